@@ -0,0 +1,251 @@
+from rev_api.ApiAgents import APIAgent, split_range
+from rev_api.TaskScheduler import TaskScheduler
+from rev_api.Metrics import METRICS, export_metrics
+from urllib.parse import urlencode, parse_qsl
+import os, sys, json, time, getopt
+from utils.utils import setup_logger
+
+## Recalculo de datos derivados para un portafolio completo: cada planta del portafolio y
+## cada ventana del rango de fechas es un job (generate_hper, calculate_data, ...). Los jobs
+## se programan con un maximo de tareas en vuelo y se esperan todos juntos en un TaskScheduler.
+
+BATCH_OPERATIONS = ["generate_hper", "generate_daily_availability", "generate_daily_metrics",
+                    "calculate_data", "recalculate_data"]
+
+
+def portfolio_plant_ids(response):
+    ## get_portfolio_plants puede devolver ids sueltos o dicts; plant_id va primero porque 'id'
+    ## puede ser el de la relacion portafolio-planta
+    if isinstance(response, dict):
+        response = response.get('plants', response.get('results', []))
+    plant_ids = []
+    for plant in response or []:
+        if isinstance(plant, dict):
+            plant = plant.get('plant_id', plant.get('id'))
+        if plant is not None:
+            plant_ids.append(str(plant))
+    return plant_ids
+
+def status_table(results):
+    header = f"{'plant':<8}{'window':<25}{'operation':<30}{'status':<10}{'polls':>6}{'elapsed':>10}"
+    lines = [header, '-' * len(header)]
+    for result in results:
+        window = f"{result['start_date']} - {result['end_date']}"
+        lines.append(f"{result['plant_id']:<8}{window:<25}{result['operation']:<30}"
+                     f"{str(result.get('status')):<10}{result.get('polls', 0):>6}"
+                     f"{result.get('elapsed', 0.0):>9.2f}s")
+    return '\n'.join(lines)
+
+
+class BatchPipeline:
+    def __init__(self, operation, start_date, end_date, window=None, max_in_flight=None, force=False,
+                 log_level='INFO', agent=None):
+        if operation not in BATCH_OPERATIONS:
+            raise ValueError(f"Invalid operation: {operation}")
+        if max_in_flight is None:
+            max_in_flight = int(os.getenv('BATCH_MAX_IN_FLIGHT', '8'))
+        self.logger = setup_logger(log_level)
+        self.operation = operation
+        self.start_date = start_date
+        self.end_date = end_date
+        self.window = window
+        self.max_in_flight = max_in_flight
+        self.force = force
+        self.agent = agent if agent is not None else APIAgent()
+        self.plant_ids = []
+        self.results = None
+        self.elapsed = None
+
+    def __str__(self):
+        return (f"BatchPipeline object with operation: {self.operation}, plant_ids: {self.plant_ids}, "
+                f"range: {self.start_date} - {self.end_date}, window: {self.window}")
+
+    def load_portfolio(self, portfolio_id):
+        response = self.agent.get_portfolio_plants(str(portfolio_id))
+        if response is None:
+            raise ValueError(f"Could not get plants for portfolio {portfolio_id}")
+        self.plant_ids = portfolio_plant_ids(response)
+        self.logger.info(f"Portfolio {portfolio_id}: {len(self.plant_ids)} plants")
+        return self.plant_ids
+
+    def windows(self):
+        ## ventanas [inicio, fin] que no se solapan (ver split_range), asi ningun dia se recalcula
+        ## en dos jobs a la vez; sin window el rango completo es un solo job por planta, con la
+        ## misma validacion del rango
+        windows = split_range(self.start_date, self.end_date, self.window or 'day')
+        if self.window is None and windows:
+            return [(self.start_date, self.end_date)]
+        return windows
+
+    def jobs(self):
+        ## (operation, plant_id, query_params) para cada planta x ventana
+        jobs = []
+        for plant_id in self.plant_ids:
+            for start_date, end_date in self.windows():
+                params = {'start_date': start_date, 'end_date': end_date}
+                if self.operation == 'recalculate_data':
+                    params['force'] = str(self.force).lower()
+                jobs.append((self.operation, plant_id, '?' + urlencode(params)))
+        return jobs
+
+    def run(self):
+        if not self.agent.auth():
+            self.logger.error("Authentication failed")
+            return None
+        jobs = self.jobs()
+        self.logger.info(f"Submitting {len(jobs)} jobs ({len(self.plant_ids)} plants x "
+                         f"{len(self.windows())} windows), max {self.max_in_flight} in flight")
+        scheduler = TaskScheduler(self.agent, max_in_flight=self.max_in_flight)
+        start = time.perf_counter()
+        results = scheduler.run(jobs)
+        self.elapsed = time.perf_counter() - start
+        for result in results:
+            params = dict(parse_qsl(result['query'].lstrip('?')))
+            result['start_date'] = params['start_date']
+            result['end_date'] = params['end_date']
+        self.results = results
+        failed = sum(1 for result in results if result.get('status') != 'success')
+        self.logger.info(f"{len(results)} jobs resolved in {self.elapsed:.2f}s with {scheduler.polls} "
+                         f"result polls, {failed} failed")
+        return results
+
+    def report(self):
+        return {'operation': self.operation, 'start_date': self.start_date, 'end_date': self.end_date,
+                'window': self.window, 'elapsed': round(self.elapsed or 0.0, 3),
+                'jobs': [{key: result.get(key) for key in
+                          ['plant_id', 'start_date', 'end_date', 'status', 'message', 'polls', 'elapsed']}
+                         for result in self.results or []]}
+
+    def save_report(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+        return filename
+
+
+def main(argv):
+    help_message = f"""
+    Usage: python BatchPipeline.py <options> <operation>
+
+    Operations: {', '.join(BATCH_OPERATIONS)}
+
+    Options:
+        -h, --help              Show this help message and exit.
+        -l, --log_level         Log level (default: INFO).
+        -p, --portfolio         Portfolio id, every plant of the portfolio is included.
+        -i, --id                Plant ids (comma separated), instead of or in addition to -p.
+        -s, --start_date        Start date YYYY-MM-DD.
+        -e, --end_date          End date YYYY-MM-DD.
+        -W, --window            Split the range in windows: day, week or a number of days
+                                (default: the whole range as a single job per plant).
+        -c, --concurrency       Maximum tasks in flight (default: BATCH_MAX_IN_FLIGHT or 8).
+        -f, --force             Send force=true with recalculate_data.
+        -o, --output            Save the per-job report as JSON.
+        -m, --metrics           Write REV API request metrics as JSON (default: METRICS_PATH).
+        --prometheus            Also write them as a Prometheus textfile (default: METRICS_PROM_PATH).
+    """
+    options = "hl:p:i:s:e:W:c:fo:m:"
+    long_options = ["help", "log_level=", "portfolio=", "id=", "start_date=", "end_date=", "window=",
+                    "concurrency=", "force", "output=", "metrics=", "prometheus="]
+    log_level = "INFO"
+    portfolio_id = None
+    plant_ids = []
+    start_date = None
+    end_date = None
+    window = None
+    concurrency = None
+    force = False
+    output_path = None
+    metrics_path = None
+    prometheus_path = None
+
+    try:
+        opts, args = getopt.gnu_getopt(argv, options, long_options)
+    except getopt.GetoptError as e:
+        print(e)
+        print('Invalid arguments')
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(help_message)
+            sys.exit()
+        elif opt in ("-l", "--log_level"):
+            if arg not in ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]:
+                print("Invalid log level")
+                sys.exit(2)
+            log_level = arg
+        elif opt in ("-p", "--portfolio"):
+            if not arg.isdigit():
+                print("Invalid portfolio id")
+                sys.exit(2)
+            portfolio_id = arg
+        elif opt in ("-i", "--id"):
+            plant_ids = [plant_id.strip() for plant_id in arg.split(",")]
+            if not all(plant_id.isdigit() for plant_id in plant_ids):
+                print("Invalid plant id")
+                sys.exit(2)
+        elif opt in ("-s", "--start_date"):
+            start_date = arg
+        elif opt in ("-e", "--end_date"):
+            end_date = arg
+        elif opt in ("-W", "--window"):
+            if arg not in ["day", "week"] and (not arg.isdigit() or int(arg) < 1):
+                print("Invalid window")
+                sys.exit(2)
+            window = arg
+        elif opt in ("-c", "--concurrency"):
+            if not arg.isdigit() or int(arg) < 1:
+                print("Invalid concurrency")
+                sys.exit(2)
+            concurrency = int(arg)
+        elif opt in ("-f", "--force"):
+            force = True
+        elif opt in ("-o", "--output"):
+            output_path = arg
+        elif opt in ("-m", "--metrics"):
+            metrics_path = arg
+        elif opt == "--prometheus":
+            prometheus_path = arg
+
+    if not args or args[0] not in BATCH_OPERATIONS:
+        print("Invalid operation")
+        print(help_message)
+        sys.exit(2)
+    if portfolio_id is None and not plant_ids:
+        print("A portfolio (-p) or plant ids (-i) are required")
+        sys.exit(2)
+    if start_date is None:
+        start_date = input("Enter start date (YYYY-MM-DD): ")
+    if end_date is None:
+        end_date = input("Enter end date (YYYY-MM-DD): ")
+    try:
+        pipeline = BatchPipeline(args[0], start_date, end_date, window, concurrency, force, log_level)
+        if not pipeline.windows():
+            print("Invalid date range")
+            sys.exit(2)
+    except ValueError as e:
+        print(e)
+        sys.exit(2)
+    if not pipeline.agent.auth():
+        print("Authentication failed")
+        sys.exit(1)
+    if portfolio_id is not None:
+        try:
+            pipeline.load_portfolio(portfolio_id)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+    pipeline.plant_ids += [plant_id for plant_id in plant_ids if plant_id not in pipeline.plant_ids]
+    results = pipeline.run()
+    if results is None:
+        sys.exit(1)
+    print(status_table(results))
+    if output_path is not None:
+        pipeline.save_report(output_path)
+    METRICS.log_summary(pipeline.logger)
+    export_metrics(metrics_path, prometheus_path)
+    pipeline.agent.close()
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
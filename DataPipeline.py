@@ -1,12 +1,36 @@
 from api_consumer import api_data_downloader, imputer, InfoMap
-from rev_api import revapi_cli
+from rev_api.UploadSession import UploadSession, upload_failed
 from rev_api.plantsMap import plantMap
-import sys, os
+from rev_api.Metrics import METRICS, export_metrics
+from utils.StageExecutor import Stage, StageExecutor
+from utils.Tracing import TRACER, enable_tracing, save_trace, span
+from concurrent.futures import ProcessPoolExecutor
+import sys, os, time, getopt
 import logging
+import resource
+
+
+def impute_file(operator, data_path):
+    ## corre dentro de un proceso del pool; ru_maxrss es el pico del proceso worker.
+    ## stats lleva el inicio y el pid para trazar la imputacion en el proceso donde corrio
+    start = time.perf_counter()
+    imputed_path, incidents_path = imputer.main([str(operator), str(data_path)])
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss *= 1024
+    stats = {'peak_rss': peak_rss, 'start': start, 'elapsed': time.perf_counter() - start, 'pid': os.getpid()}
+    return imputed_path, incidents_path, stats
+
+def trace_imputation(plant, table, stats):
+    TRACER.add(f"impute {plant}", 'impute', stats['start'], stats['elapsed'], pid=stats['pid'],
+               tid=stats['pid'], thread_name=f"impute worker {stats['pid']}", args={'plant': plant, 'table': table})
+    return
 
 
 class DataPipeline:
-    def __init__(self, plants, date=None, start_date=None, end_date=None, log_level=logging.INFO):
+    def __init__(self, plants, date=None, start_date=None, end_date=None, log_level=logging.INFO,
+                 impute_workers=None, download_workers=None, upload_workers=None, queue_size=None,
+                 sync=False, resume=None):
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(log_level)
         self.operators = self.search_api_server(plants)
@@ -21,6 +45,18 @@ class DataPipeline:
         self.imputed_weather_paths = None
         self.incidents_gen_paths = None
         self.incidents_weather_paths = None
+        if impute_workers is None:
+            impute_workers = int(os.getenv('IMPUTE_WORKERS', str(os.cpu_count() or 1)))
+        self.impute_workers = max(impute_workers, 1)
+        self.download_workers = max(download_workers or int(os.getenv('DOWNLOAD_WORKERS', '2')), 1)
+        self.upload_workers = max(upload_workers or int(os.getenv('UPLOAD_STAGE_WORKERS', '1')), 1)
+        self.queue_size = max(queue_size or int(os.getenv('STAGE_QUEUE_SIZE', '2')), 1)
+        self.stage_report = []
+        self.sync = sync
+        self.resume = resume
+        self.sync_report = []
+        self.failed_plants = set()
+        self.impute_report = []
 
     def __str__(self):
         return (f"DataPipeline object with plants: {self.plants}, plant_ids: {self.plant_ids}, "
@@ -31,10 +67,16 @@ class DataPipeline:
         for path in (self.gen_data_paths + self.weather_data_paths +
                      self.imputed_gen_paths + self.imputed_weather_paths +
                      self.incidents_gen_paths + self.incidents_weather_paths):
-            os.remove(path)
+            if path is not None:
+                os.remove(path)
         self.logger.info("Cleaned up all temporary files")
 
 
+    def download_args(self, index):
+        if self.date:
+            return [self.operators[index], "-d", self.date, "-p", self.plants[index]]
+        return [self.operators[index], self.start_date, self.end_date, "-p", self.plants[index]]
+
     def extract_plant_ids(self):
         plant_ids = []
         for plant in self.plants:
@@ -58,11 +100,8 @@ class DataPipeline:
         gen_data_paths = []
         weather_data_paths = []
         for index, plant_id in enumerate(self.plant_ids):
-            if self.date:
-                args = [self.operators[index], "-d", self.date, "-p", self.plants[index]]
-            else:
-                args = [self.operators[index], self.start_date, self.end_date, "-p", self.plants[index]]
-            gen_data_path, weather_data_path = api_data_downloader.main(args)
+            with span(f"download_data {self.plants[index]}", 'download', plant=self.plants[index]):
+                gen_data_path, weather_data_path = api_data_downloader.main(self.download_args(index))
             gen_data_paths.extend(gen_data_path)
             weather_data_paths.extend(weather_data_path)
         self.gen_data_paths = gen_data_paths
@@ -71,40 +110,216 @@ class DataPipeline:
         return
 
     def impute_data(self):
-        imputed_gen_paths = []
-        imputed_weather_paths = []
-        incidents_gen_paths = []
-        incidents_weather_paths = []
-        for index, plant_id in enumerate(self.plant_ids):
-            imputed_path, incidents_path = imputer.main([str(self.operators[index]),
-                                                        str(self.gen_data_paths[index])])
-            imputed_gen_paths.append(imputed_path)
-            incidents_gen_paths.append(incidents_path)
-            imputed_path, incidents_path = imputer.main([ str(self.operators[index]),
-                                                        str(self.weather_data_paths[index])])
-            imputed_weather_paths.append(imputed_path)
-            incidents_weather_paths.append(incidents_path)
-        self.imputed_gen_paths = imputed_gen_paths
-        self.imputed_weather_paths = imputed_weather_paths
-        self.incidents_gen_paths = incidents_gen_paths
-        self.incidents_weather_paths = incidents_weather_paths
-        self.logger.info("Data imputed successfully")
+        ## un job por planta y archivo (gen y weather) repartidos en un pool de procesos;
+        ## los resultados se guardan por indice asi el orden no depende de cual termine primero
+        jobs = []
+        for index in range(len(self.plant_ids)):
+            jobs.append((index, 'gen', self.gen_data_paths[index]))
+            jobs.append((index, 'weather', self.weather_data_paths[index]))
+        results = {}
+        with ProcessPoolExecutor(max_workers=min(self.impute_workers, len(jobs) or 1)) as executor:
+            futures = {executor.submit(impute_file, self.operators[index], data_path): (index, kind)
+                       for index, kind, data_path in jobs}
+            for future, (index, kind) in futures.items():
+                try:
+                    imputed_path, incidents_path, stats = future.result()
+                except Exception as e:
+                    self.logger.error(f"Imputation failed for {self.plants[index]} ({kind}): {e}")
+                    self.failed_plants.add(index)
+                    results[(index, kind)] = (None, None)
+                    continue
+                results[(index, kind)] = (imputed_path, incidents_path)
+                trace_imputation(self.plants[index], kind, stats)
+                self.impute_report.append({'plant': self.plants[index], 'table': kind,
+                                           'elapsed': round(stats['elapsed'], 2), 'peak_rss': stats['peak_rss']})
+                self.logger.info(f"Imputed {kind} data for {self.plants[index]} in {stats['elapsed']:.1f}s, "
+                                 f"worker peak memory {stats['peak_rss'] / 1e6:.0f} MB")
+        self.imputed_gen_paths = [results[(index, 'gen')][0] for index in range(len(self.plant_ids))]
+        self.incidents_gen_paths = [results[(index, 'gen')][1] for index in range(len(self.plant_ids))]
+        self.imputed_weather_paths = [results[(index, 'weather')][0] for index in range(len(self.plant_ids))]
+        self.incidents_weather_paths = [results[(index, 'weather')][1] for index in range(len(self.plant_ids))]
+        if self.impute_report:
+            self.logger.info(f"Peak imputation worker memory: "
+                             f"{max(job['peak_rss'] for job in self.impute_report) / 1e6:.0f} MB "
+                             f"({self.impute_workers} workers)")
+        if self.failed_plants:
+            self.logger.error(f"Imputation failed for {len(self.failed_plants)} plants")
+        else:
+            self.logger.info("Data imputed successfully")
         return
 
+    def upload_measurements(self, session, table, index, path):
+        ## en modo sync solo se suben filas nuevas y se actualizan las que cambiaron
+        plant_id = self.plant_ids[index]
+        if not self.sync:
+            if table == 'gen':
+                return session.upload_gen(plant_id, path)
+            return session.upload_weather(plant_id, path)
+        report = session.sync(table, plant_id, path)
+        if report is not None:
+            self.sync_report.append({'plant': self.plants[index], **report})
+        return report
+
     def upload_data(self):
-        for index, plant_id in enumerate(self.plant_ids):
-            args = ['post_gen_measurements', '-i', str(plant_id), '-f', self.imputed_gen_paths[index], '-A']
-            revapi_cli.main(args)
-            args = ['post_weather_measurements', '-i', str(plant_id), '-f', self.imputed_weather_paths[index], '-A']
-            revapi_cli.main(args)
-            args = ['post_incidents', '-i', str(plant_id), '-f', self.incidents_gen_paths[index], '-t', 'gen', '-A']
-            revapi_cli.main(args)
-            args = ['post_incidents', '-i', str(plant_id), '-f', self.incidents_weather_paths[index], '-t', 'weather', '-A']
-            revapi_cli.main(args)
+        with UploadSession(admin=True, resume=self.resume) as session:
+            if not session.auth():
+                self.logger.error("Authentication failed, data not uploaded")
+                return
+            for index, plant_id in enumerate(self.plant_ids):
+                if index in self.failed_plants:
+                    self.logger.error(f"Skipping upload for {self.plants[index]}, imputation failed")
+                    continue
+                with span(f"upload_data {self.plants[index]}", 'upload', plant=self.plants[index]):
+                    responses = [
+                        self.upload_measurements(session, 'gen', index, self.imputed_gen_paths[index]),
+                        self.upload_measurements(session, 'weather', index, self.imputed_weather_paths[index]),
+                        session.upload_incidents(plant_id, 'gen', self.incidents_gen_paths[index]),
+                        session.upload_incidents(plant_id, 'weather', self.incidents_weather_paths[index]),
+                    ]
+                if any(upload_failed(response) for response in responses):
+                    self.logger.error(f"Upload failed for {self.plants[index]}")
         self.logger.info("Data uploaded successfully")
         return
 
+    ## Ejecucion en streaming: mientras una planta se imputa, la siguiente se descarga y la
+    ## anterior se sube. Cada item es un dict con los archivos de una planta.
+
+    def download_stage(self, job):
+        plant = self.plants[job['index']]
+        with span(f"download_data {plant}", 'download', plant=plant):
+            gen_data_paths, weather_data_paths = api_data_downloader.main(self.download_args(job['index']))
+        job['data_paths'] = list(gen_data_paths) + list(weather_data_paths)
+        job['tables'] = ['gen'] * len(gen_data_paths) + ['weather'] * len(weather_data_paths)
+        return job
+
+    def impute_stage(self, job, executor):
+        plant = self.plants[job['index']]
+        with span(f"impute_data {plant}", 'impute', plant=plant):
+            futures = [executor.submit(impute_file, self.operators[job['index']], data_path)
+                       for data_path in job['data_paths']]
+            job['imputed'] = []
+            for table, future in zip(job['tables'], futures):
+                imputed_path, incidents_path, stats = future.result()
+                job['imputed'].append((table, imputed_path, incidents_path))
+                trace_imputation(plant, table, stats)
+                self.impute_report.append({'plant': plant, 'table': table,
+                                           'elapsed': round(stats['elapsed'], 2), 'peak_rss': stats['peak_rss']})
+        return job
+
+    def upload_stage(self, job, session):
+        plant_id = self.plant_ids[job['index']]
+        plant = self.plants[job['index']]
+        responses = []
+        with span(f"upload_data {plant}", 'upload', plant=plant):
+            for table, imputed_path, incidents_path in job['imputed']:
+                responses.append(self.upload_measurements(session, table, job['index'], imputed_path))
+                responses.append(session.upload_incidents(plant_id, table, incidents_path))
+        if any(upload_failed(response) for response in responses):
+            raise RuntimeError("Upload failed")
+        return job
+
+    def clean_job(self, job):
+        paths = list(job.get('data_paths', []))
+        for _, imputed_path, incidents_path in job.get('imputed', []):
+            paths.extend([imputed_path, incidents_path])
+        for path in paths:
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+        return
+
+    def run(self, clean=False):
+        jobs = [{'index': index} for index in range(len(self.plant_ids))]
+        with ProcessPoolExecutor(max_workers=self.impute_workers) as impute_executor, \
+                UploadSession(admin=True, resume=self.resume, uploads=self.upload_workers) as session:
+            if not session.auth():
+                self.logger.error("Authentication failed, pipeline not started")
+                return None
+            executor = StageExecutor([
+                Stage('download', self.download_stage, self.download_workers),
+                Stage('impute', lambda job: self.impute_stage(job, impute_executor), self.impute_workers),
+                Stage('upload', lambda job: self.upload_stage(job, session), self.upload_workers),
+            ], queue_size=self.queue_size)
+            results = executor.run(jobs)
+        for result in results:
+            plant = self.plants[result.index]
+            if result.ok:
+                self.logger.info(f"Pipeline completed for {plant}")
+            else:
+                self.failed_plants.add(result.index)
+                self.logger.error(f"Pipeline failed for {plant} at {result.failed_stage}: {result.error}")
+            if clean:
+                self.clean_job(result.value)
+        executor.log_report(self.logger)
+        self.stage_report = executor.report()
+        return results
+
 def main(argv):
+    help_message = """
+    Usage: python DataPipeline.py <options>
+
+    Options:
+        -h, --help              Show this help message and exit.
+        -w, --workers           Number of imputation processes (default: IMPUTE_WORKERS
+                                or the number of CPUs).
+        -d, --download_workers  Number of concurrent plant downloads (default: 2).
+        -u, --upload_workers    Number of concurrent plant uploads (default: 1).
+        -q, --queue_size        Plants buffered between stages (default: 2).
+        -s, --sequential        Run download, imputation and upload one after the other.
+        -S, --sync              Only post rows missing on the server and update changed ones.
+        -m, --metrics           Write REV API request metrics (counts, status codes, p50/p95/p99
+                                latency, bytes, retries) as JSON (default: METRICS_PATH).
+        --prometheus            Also write them as a Prometheus textfile (default: METRICS_PROM_PATH).
+        --no_resume             Upload every file from the start, ignoring rows acknowledged by an
+                                interrupted upload (default: UPLOAD_RESUME).
+        -T, --trace             Write per plant and stage spans, with the HTTP calls nested, as a
+                                Chrome trace file for Perfetto or chrome://tracing (default: TRACE_PATH).
+    """
+    options = "hw:d:u:q:sSm:T:"
+    long_options = ["help", "workers=", "download_workers=", "upload_workers=", "queue_size=",
+                    "sequential", "sync", "metrics=", "prometheus=", "trace=", "no_resume"]
+    trace_path = None
+    metrics_path = None
+    prometheus_path = None
+    impute_workers = None
+    stage_options = {}
+    sequential = False
+
+    try:
+        opts, args = getopt.gnu_getopt(argv, options, long_options)
+    except getopt.GetoptError as e:
+        print(e)
+        print('Invalid arguments')
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(help_message)
+            sys.exit()
+        elif opt in ("-w", "--workers"):
+            if not arg.isdigit() or int(arg) < 1:
+                print("Invalid number of workers")
+                sys.exit(2)
+            impute_workers = int(arg)
+        elif opt in ("-d", "--download_workers", "-u", "--upload_workers", "-q", "--queue_size"):
+            if not arg.isdigit() or int(arg) < 1:
+                print(f"Invalid value for {opt}")
+                sys.exit(2)
+            key = {"-d": "download_workers", "-u": "upload_workers",
+                   "-q": "queue_size"}.get(opt, opt.lstrip("-"))
+            stage_options[key] = int(arg)
+        elif opt in ("-s", "--sequential"):
+            sequential = True
+        elif opt in ("-S", "--sync"):
+            stage_options["sync"] = True
+        elif opt in ("-m", "--metrics"):
+            metrics_path = arg
+        elif opt == "--prometheus":
+            prometheus_path = arg
+        elif opt == "--no_resume":
+            stage_options["resume"] = False
+        elif opt in ("-T", "--trace"):
+            trace_path = arg
+
+    enable_tracing(trace_path)
     plants = input("Enter the plant name: ").split(",")
     date_or_range = input("Enter the date or date range: (d/r): ")
     while date_or_range != 'd' and date_or_range != 'r':
@@ -112,18 +327,31 @@ def main(argv):
     try:
         if date_or_range == 'd':
             date = input("Enter the date: ")
-            pipeline = DataPipeline(plants, date=date)
+            pipeline = DataPipeline(plants, date=date, impute_workers=impute_workers, **stage_options)
         else:
             start_date = input("Enter the start date: ")
             end_date = input("Enter the end date: ")
-            pipeline = DataPipeline(plants, start_date=start_date, end_date=end_date)
+            pipeline = DataPipeline(plants, start_date=start_date, end_date=end_date,
+                                    impute_workers=impute_workers, **stage_options)
     except ValueError as e:
         print(e)
         sys.exit(1)
-    pipeline.download_data()
-    pipeline.impute_data()
-    pipeline.upload_data()
-
+    if sequential:
+        with span('download_data', 'stage'):
+            pipeline.download_data()
+        with span('impute_data', 'stage'):
+            pipeline.impute_data()
+        with span('upload_data', 'stage'):
+            pipeline.upload_data()
+    else:
+        with span('run', 'stage', plants=len(pipeline.plants)):
+            pipeline.run()
+    for report in pipeline.sync_report:
+        print(f"{report['plant']} {report['table']}: {report['new']} new, {report['changed']} changed, "
+              f"{report['unchanged']} unchanged, {report['updated']} updated")
+    METRICS.log_summary(pipeline.logger)
+    export_metrics(metrics_path, prometheus_path)
+    save_trace()
     return
 
 
@@ -1,8 +1,33 @@
-from prmt_api.Consumer import Consumer
-from rev_api import revapi_cli
+from prmt_api.Consumer import Consumer, make_session, group_by_point, fetch_group
+from prmt_api.MPoints import measurementPointsMap
+from prmt_api.ResponseCache import ResponseCache
+from rev_api.UploadSession import UploadSession, upload_failed
 from rev_api.plantsMap import plantMap
-import sys, logging, getopt
+from rev_api.Metrics import METRICS, export_metrics
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os, sys, logging, getopt
 from utils.utils import setup_logger
+from utils.Tracing import enable_tracing, save_trace, span
+
+
+def traced_fetch_group(group, period, output_format):
+    ## fetch_group con un span por punto de medida y periodo (plantas del grupo en args)
+    with span(f"fetch {group[0].point} {period}", 'download', point=group[0].point, period=period,
+              plants=[consumer.plant for consumer in group]):
+        return fetch_group(group, period, output_format)
+
+def month_periods(start_month, end_month):
+    ## meses YYYYMM inclusive, en el formato de periodo del CEN (YYYYMM010000)
+    start_year, start = int(start_month[:4]), int(start_month[4:6])
+    end_year, end = int(end_month[:4]), int(end_month[4:6])
+    if not 1 <= start <= 12 or not 1 <= end <= 12 or (start_year, start) > (end_year, end):
+        raise ValueError(f"Invalid month range: {start_month}-{end_month}")
+    periods = []
+    year, month = start_year, start
+    while (year, month) <= (end_year, end):
+        periods.append(f"{year:04d}{month:02d}010000")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
 
 class PRMTPipeline:
     def __init__(self, plants: list, period: str, log_level='INFO'):
@@ -11,6 +36,8 @@ class PRMTPipeline:
         self.plant_ids = self.get_plant_ids()
         self.period = period
         self.downloaded_paths = None
+        self.backfill_paths = None
+        self.cache = ResponseCache() if os.getenv('PRMT_CACHE', '1') != '0' else None
 
     def __str__(self):
         return (f"PRMTPipeline object with plants: {self.plants}, plant_ids: {self.plant_ids}, "
@@ -26,30 +53,100 @@ class PRMTPipeline:
         return plant_ids
 
     def download_prmt_data(self, output_format='json'):
-        downloaded_paths = []
-        for plant in self.plants:
-            consumer = Consumer(plant)
-            filename = consumer.pipeline(self.period, output_format=output_format)
-            downloaded_paths.append(filename)
-        self.downloaded_paths = downloaded_paths
-        return downloaded_paths
+        consumers = [Consumer(plant, cache=self.cache) for plant in self.plants]
+        filenames = {}
+        for group in group_by_point(consumers):
+            for consumer, filename in zip(group, traced_fetch_group(group, self.period, output_format)):
+                filenames[consumer.plant] = filename
+        self.downloaded_paths = [filenames[plant] for plant in self.plants]
+        if self.cache is not None:
+            self.cache.log_stats(self.logger)
+        return self.downloaded_paths
+
+    def backfill_prmt_data(self, periods, concurrency=None, output_format='json'):
+        ## una llamada por punto de medida y mes, concurrentes sobre una sola sesion con pool;
+        ## cada archivo se escribe apenas termina su llamada
+        if concurrency is None:
+            concurrency = int(os.getenv('PRMT_CONCURRENCY', '4'))
+        concurrency = max(concurrency, 1)
+        session = make_session(concurrency)
+        consumers = [Consumer(plant, session=session, cache=self.cache) for plant in self.plants]
+        indexes = {plant: index for index, plant in enumerate(self.plants)}
+        backfill_paths = {}
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {executor.submit(traced_fetch_group, group, period, output_format): (group, period)
+                           for group in group_by_point(consumers) for period in periods}
+                for future in as_completed(futures):
+                    group, period = futures[future]
+                    try:
+                        filenames = future.result()
+                    except Exception as e:
+                        self.logger.error(f"Download failed for {group[0].point}, period {period}: {e}")
+                        filenames = [None] * len(group)
+                    for consumer, filename in zip(group, filenames):
+                        backfill_paths[(indexes[consumer.plant], period)] = filename
+        finally:
+            session.close()
+        self.backfill_paths = {key: backfill_paths[key] for key in sorted(backfill_paths)}
+        failed = sum(path is None for path in backfill_paths.values())
+        self.logger.info(f"Backfill finished: {len(backfill_paths) - failed} files downloaded, "
+                         f"{failed} failed")
+        if self.cache is not None:
+            self.cache.log_stats(self.logger)
+        return self.backfill_paths
+
+    def upload_jobs(self):
+        if self.backfill_paths is not None:
+            return [(index, path) for (index, _), path in self.backfill_paths.items()]
+        return list(enumerate(self.downloaded_paths))
 
     def upload_prmt_data(self):
-        for index, plant_id in enumerate(self.plant_ids):
-            args = ['post_prmt_measurements', '-i', str(plant_id), '-f', self.downloaded_paths[index], '-A']
-            revapi_cli.main(args)
-            self.logger.info(f"Uploaded data for {self.plants[index]}")
+        with UploadSession(admin=True) as session:
+            if not session.auth():
+                self.logger.error("Authentication failed, data not uploaded")
+                return
+            for index, path in self.upload_jobs():
+                if path is None:
+                    self.logger.error(f"No data downloaded for {self.plants[index]}")
+                    continue
+                with span(f"upload_prmt_data {self.plants[index]}", 'upload', plant=self.plants[index], path=path):
+                    response = session.upload_prmt(self.plant_ids[index], path)
+                if upload_failed(response):
+                    self.logger.error(f"Upload failed for {self.plants[index]}: {path}")
+                    continue
+                self.logger.info(f"Uploaded data for {self.plants[index]}: {path}")
         return
 
 
 def main(argv):
     help_message = """
     Usage: python PRMTPipeline.py <options>
+
+    Options:
+        -h, --help              Show this help message and exit.
+        -l, --log_level         Log level (default: INFO).
+        -f, --format            Output format, json, csv or npz (compressed columnar,
+                                default: json).
+        -b, --backfill          Month range YYYYMM-YYYYMM to download for every plant.
+                                Use "all" as plant name for every plant in measurementPointsMap.
+        -c, --concurrency       Concurrent CEN requests in backfill mode (default: 4).
+        -m, --metrics           Write REV API request metrics of the upload as JSON
+                                (default: METRICS_PATH).
+        --prometheus            Also write them as a Prometheus textfile (default: METRICS_PROM_PATH).
+        -T, --trace             Write per plant and stage spans, with the HTTP calls nested, as a
+                                Chrome trace file for Perfetto or chrome://tracing (default: TRACE_PATH).
     """
-    options = "hl:f:"
-    long_options = ["help", "log_level=", "format=", "csv"]
+    options = "hl:f:b:c:m:T:"
+    long_options = ["help", "log_level=", "format=", "csv", "backfill=", "concurrency=", "metrics=",
+                    "prometheus=", "trace="]
     log_level = "INFO"
     output_format = "json"
+    backfill = None
+    concurrency = None
+    metrics_path = None
+    prometheus_path = None
+    trace_path = None
 
     try:
         opts, args = getopt.gnu_getopt(argv, options, long_options)
@@ -67,33 +164,70 @@ def main(argv):
                 sys.exit(2)
             log_level = arg
         elif opt in ("-f", "--format"):
-            if arg not in ["json", "csv"]:
+            if arg not in ["json", "csv", "npz"]:
                 print("Invalid format")
                 sys.exit(2)
             output_format = arg
         elif opt in ("--csv"):
             output_format = "csv"
+        elif opt in ("-b", "--backfill"):
+            try:
+                backfill = month_periods(*arg.split("-"))
+            except (TypeError, ValueError):
+                print("Invalid month range, expected YYYYMM-YYYYMM")
+                sys.exit(2)
+        elif opt in ("-c", "--concurrency"):
+            if not arg.isdigit() or int(arg) < 1:
+                print("Invalid concurrency")
+                sys.exit(2)
+            concurrency = int(arg)
+        elif opt in ("-m", "--metrics"):
+            metrics_path = arg
+        elif opt == "--prometheus":
+            prometheus_path = arg
+        elif opt in ("-T", "--trace"):
+            trace_path = arg
 
+    enable_tracing(trace_path)
     plants = input("Enter the plants names (comma separated): ").split(",")
-    year = input("Enter the year (YYYY): ")
-    while len(year) != 4 or not year.isdigit():
+    if backfill is not None:
+        if plants == ["all"]:
+            plants = list(measurementPointsMap.keys())
+        try:
+            pipeline = PRMTPipeline(plants, backfill[0], log_level)
+        except ValueError as e:
+            print(e)
+            sys.exit(2)
+        with span('backfill_prmt_data', 'stage', periods=len(backfill)):
+            pipeline.backfill_prmt_data(backfill, concurrency, output_format)
+    else:
         year = input("Enter the year (YYYY): ")
-    month = input("Enter the month (MM): ")
-    while len(month) != 2 or not month.isdigit() or int(month) < 1 or int(month) > 12:
+        while len(year) != 4 or not year.isdigit():
+            year = input("Enter the year (YYYY): ")
         month = input("Enter the month (MM): ")
-    period = year + month +"010000"
-    pipeline = PRMTPipeline(plants, period, log_level)
-    pipeline.download_prmt_data(output_format)
-    if output_format == 'json':
+        while len(month) != 2 or not month.isdigit() or int(month) < 1 or int(month) > 12:
+            month = input("Enter the month (MM): ")
+        period = year + month +"010000"
+        try:
+            pipeline = PRMTPipeline(plants, period, log_level)
+        except ValueError as e:
+            print(e)
+            sys.exit(2)
+        with span('download_prmt_data', 'stage', period=period):
+            pipeline.download_prmt_data(output_format)
+    if output_format in ['json', 'npz']:
         upload = input("Upload data? (y/n): ")
         while upload != 'y' and upload != 'n':
             upload = input("Upload data? (y/n): ")
         if upload == 'y':
-            pipeline.upload_prmt_data()
-            return
-        print("Cancelled")
+            with span('upload_prmt_data', 'stage'):
+                pipeline.upload_prmt_data()
+            METRICS.log_summary(pipeline.logger)
+            export_metrics(metrics_path, prometheus_path)
+        elif backfill is None:
+            print("Cancelled")
+    save_trace()
     return
 
-
 if __name__ == "__main__":
     main(sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,68 @@
+import os, sys, json, time, tempfile, getopt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rev_api.DataReaders import write_npz, load_columns, iter_records
+from prmt_api.Measurements import MeasurementColumns
+from bench_handoff import generate_gen_file
+from bench_prmt_format import generate_payload
+
+## Compara tamano en disco y tiempo de carga de los archivos intermedios:
+##   json indent=4 (como escribia save_json_data), json compacto y npz comprimido.
+## La carga de npz se mide como columnas (load_columns) y como registros (iter_records).
+##
+## Uso: python benchmarks/bench_formats.py [-n filas gen] [-m meses prmt]
+
+
+def timed(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def compare(name, records, tmp):
+    paths = {
+        'json indent=4': os.path.join(tmp, f'{name}-indent.json'),
+        'json': os.path.join(tmp, f'{name}.json'),
+        'npz': os.path.join(tmp, f'{name}.npz'),
+    }
+    with open(paths['json indent=4'], 'w') as f:
+        json.dump(records, f, indent=4)
+    with open(paths['json'], 'w') as f:
+        json.dump(records, f)
+    write_npz(paths['npz'], records)
+    for label, path in paths.items():
+        size = os.path.getsize(path)
+        if label == 'npz':
+            columns = timed(lambda: load_columns(path))
+            rows = timed(lambda: list(iter_records(path)))
+            print(f"{name:<6}{label:<16}{size / 1e6:>9.2f}{columns * 1e3:>12.1f}{rows * 1e3:>12.1f}")
+        else:
+            load = timed(lambda: json.load(open(path)))
+            print(f"{name:<6}{label:<16}{size / 1e6:>9.2f}{'-':>12}{load * 1e3:>12.1f}")
+    return
+
+def main(argv):
+    rows = 50000
+    months = 12
+    opts, _ = getopt.gnu_getopt(argv, "n:m:")
+    for opt, arg in opts:
+        if opt == "-n":
+            rows = int(arg)
+        elif opt == "-m":
+            months = int(arg)
+    print(f"{'data':<6}{'format':<16}{'MB':>9}{'cols ms':>12}{'rows ms':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(generate_gen_file(os.path.join(tmp, 'source.json'), rows)) as f:
+            compare('gen', json.load(f), tmp)
+        prmt = []
+        for month in range(months):
+            prmt.extend(MeasurementColumns.from_payload(generate_payload(1 + month), '3').to_records())
+        compare('prmt', prmt, tmp)
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,85 @@
+import os, sys, json, time, random, tempfile, getopt, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rev_api.ApiAgents import prepare_chunks, chunk_body
+from rev_api.DataReaders import iter_raw_records
+
+## Compara el traspaso de datos MiddlewareAgent -> APIAgent en un archivo gen grande:
+##   legacy: json.load + json.dumps (load_data) -> json.loads -> json.dumps por chunk
+##   records: registros parseados una vez y serializados una vez al armar los chunks
+##   raw: RawRecords, el texto de cada registro se pasa tal cual del archivo al chunk
+##
+## Uso: python benchmarks/bench_handoff.py [-n filas] [-c chunk_size] [--memory]
+
+
+def generate_gen_file(path, rows, inverters=12):
+    random.seed(0)
+    with open(path, 'w') as f:
+        f.write('[')
+        for i in range(rows):
+            record = {'timestamp': f'2024-01-{1 + i // 1440 % 28:02d} {i // 60 % 24:02d}:{i % 60:02d}:00'}
+            for inv in range(1, inverters + 1):
+                record[f'inv_{inv}'] = round(random.uniform(0, 250), 3)
+            record['poa'] = round(random.uniform(0, 1100), 2)
+            f.write((',' if i else '') + json.dumps(record))
+        f.write(']')
+    return path
+
+def legacy_handoff(path, chunk_size):
+    with open(path, 'r') as f:
+        data = json.dumps(json.load(f))
+    data_list = json.loads(data)
+    sent = len(data)
+    for i in range(0, len(data_list), chunk_size):
+        sent += len(json.dumps(data_list[i:i + chunk_size]))
+    return sent
+
+def records_handoff(path, chunk_size):
+    with open(path, 'r') as f:
+        records = json.load(f)
+    chunks, _ = prepare_chunks(records, chunk_size)
+    return sum(len(chunk_body(items)) for items in chunks)
+
+def raw_handoff(path, chunk_size):
+    chunks, _ = prepare_chunks(iter_raw_records(path), chunk_size)
+    return sum(len(chunk_body(items)) for items in chunks)
+
+def measure(function, path, chunk_size, memory):
+    if memory:
+        tracemalloc.start()
+    start = time.process_time()
+    serialized = function(path, chunk_size)
+    cpu = time.process_time() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return cpu, serialized, peak
+
+def main(argv):
+    rows = 200000
+    chunk_size = 500
+    memory = False
+    opts, _ = getopt.gnu_getopt(argv, "n:c:", ["memory"])
+    for opt, arg in opts:
+        if opt == "-n":
+            rows = int(arg)
+        elif opt == "-c":
+            chunk_size = int(arg)
+        elif opt == "--memory":
+            memory = True
+    with tempfile.TemporaryDirectory() as tmp:
+        path = generate_gen_file(os.path.join(tmp, 'gen.json'), rows)
+        size = os.path.getsize(path)
+        print(f"gen file: {rows} rows, {size / 1e6:.1f} MB, chunk_size {chunk_size}")
+        print(f"{'path':<10}{'cpu s':>10}{'MB built':>12}{'peak MB':>10}")
+        for name, function in [('legacy', legacy_handoff), ('records', records_handoff),
+                               ('raw', raw_handoff)]:
+            cpu, serialized, peak = measure(function, path, chunk_size, memory)
+            peak = f"{peak / 1e6:.1f}" if peak is not None else '-'
+            print(f"{name:<10}{cpu:>10.2f}{serialized / 1e6:>12.1f}{peak:>10}")
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,76 @@
+import os, sys, json, time, random, tempfile, getopt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prmt_api.Measurements import MeasurementColumns
+
+## Compara el formateo y la escritura de medidas del CEN (sin red), para varios meses
+## de varias plantas con intervalos de 15 minutos:
+##   legacy: un dict por intervalo con str.split, json.dump indent=4 / csv fila por fila
+##   columnar: MeasurementColumns, parseo y escritura sobre arreglos numpy
+##
+## Uso: python benchmarks/bench_prmt_format.py [-m meses] [-p plantas]
+
+
+def generate_payload(month, intervals=2976):
+    random.seed(month)
+    measurements = []
+    for i in range(intervals):
+        day, minute = 1 + i // 96, (i % 96) * 15
+        measurement = {'dateRange': f'2024-{month:02d}-{day:02d}T{minute // 60:02d}:{minute % 60:02d}:00.000'}
+        for channel in range(1, 5):
+            measurement[f'channel{channel}'] = round(random.uniform(0, 900), 3)
+        measurements.append(measurement)
+    return {'period': f'2024{month:02d}010000', 'lastReadingDate': '2024-12-01T00:00:00+00:00',
+            'measurement': measurements}
+
+def legacy_format(data, channel, tmp, output_format):
+    formatted_data = []
+    for measurement in data['measurement']:
+        formatted_data.append({
+            'timestamp': measurement['dateRange'].split('.')[0],
+            'act_energy': measurement['channel' + channel],
+        })
+    filename = os.path.join(tmp, f"legacy.{output_format}")
+    with open(filename, 'w') as f:
+        if output_format == 'json':
+            json.dump(formatted_data, f, indent=4)
+        else:
+            f.write("timestamp,act_energy\n")
+            for measurement in formatted_data:
+                f.write(f"{measurement['timestamp']},{measurement['act_energy']}\n")
+    return filename
+
+def columnar_format(data, channel, tmp, output_format):
+    columns = MeasurementColumns.from_payload(data, channel)
+    filename = os.path.join(tmp, f"columnar.{output_format}")
+    if output_format == 'json':
+        return columns.save_json(filename)
+    return columns.save_csv(filename)
+
+def main(argv):
+    months = 12
+    plants = 10
+    opts, _ = getopt.gnu_getopt(argv, "m:p:")
+    for opt, arg in opts:
+        if opt == "-m":
+            months = int(arg)
+        elif opt == "-p":
+            plants = int(arg)
+    payloads = [generate_payload(1 + month % 12) for month in range(months)]
+    print(f"{plants} plants x {months} months, {plants * months * 2976} intervals")
+    print(f"{'path':<10}{'format':>8}{'cpu s':>10}{'MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for output_format in ['json', 'csv']:
+            for name, function in [('legacy', legacy_format), ('columnar', columnar_format)]:
+                start = time.process_time()
+                size = 0
+                for _ in range(plants):
+                    for data in payloads:
+                        size += os.path.getsize(function(data, '3', tmp, output_format))
+                cpu = time.process_time() - start
+                print(f"{name:<10}{output_format:>8}{cpu:>10.2f}{size / 1e6:>8.1f}")
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,12 +1,42 @@
 import requests, os, json
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from .MPoints import measurementPointsMap
+from .ResponseCache import ResponseCache
+from .Measurements import MeasurementColumns
 from utils.utils import setup_logger
+from utils.Tracing import span
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
+
+def make_session(pool_size=10):
+    ## sesion compartida entre consumers, las conexiones al CEN se reutilizan entre llamadas
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def group_by_point(consumers):
+    ## plantas que comparten punto de medida se piden juntas y se separan localmente
+    groups = {}
+    for consumer in consumers:
+        groups.setdefault(consumer.point, []).append(consumer)
+    return list(groups.values())
+
+def group_channels(consumers):
+    return ",".join(sorted({consumer.channel for consumer in consumers}, key=int))
+
+def fetch_group(consumers, period, output_format='json'):
+    ## una sola llamada por punto de medida con la union de los canales del grupo
+    data = consumers[0].request_measurements(period, group_channels(consumers))
+    return [consumer.save_measurements(data, period, output_format) for consumer in consumers]
+
+
 class Consumer:
-    def __init__(self, plant: str):
+    def __init__(self, plant: str, session=None, cache=None):
         self.base_url = os.getenv('CEN_API_URL')
         self.medidas_url = os.getenv('MEDIDAS_URL')
         self.api_key = os.getenv('API_KEY')
@@ -20,14 +50,26 @@ class Consumer:
         except KeyError:
             raise ValueError(f"Invalid plant name: {plant}")
         self.logger = setup_logger('INFO')
+        self.session = session if session is not None else requests.Session()
+        if cache is None and os.getenv('PRMT_CACHE', '1') != '0':
+            cache = ResponseCache()
+        self.cache = cache
         self.output_path = 'prmt_data'
-        if not os.path.exists(self.output_path):
-            os.makedirs(self.output_path)
+        os.makedirs(self.output_path, exist_ok=True)
 
     def __str__(self):
         return f"Consumer object for {self.plant}, point {self.point}"
 
-    def request_measurements(self, period, channels="1,2,3,4"):
+    def request_measurements(self, period, channels=None):
+        ## por defecto se pide solo el canal que se usa al formatear
+        if channels is None:
+            channels = self.channel
+        if self.cache is None:
+            return self.fetch_measurements(period, channels)
+        return self.cache.fetch(self.point, period, channels,
+                                lambda: self.fetch_measurements(period, channels))
+
+    def fetch_measurements(self, period, channels):
         params = {
             'user_key': self.api_key,
             'channelId': channels,
@@ -35,7 +77,9 @@ class Consumer:
             'measurePointId': self.point
         }
         self.logger.info(f"Requesting data for {self.plant} for period {period}")
-        response = requests.get(self.base_url + self.medidas_url, headers=self.headers, params=params)
+        with span('CEN medidas', 'http', point=self.point, period=period, channels=channels) as trace_args:
+            response = self.session.get(self.base_url + self.medidas_url, headers=self.headers, params=params)
+            trace_args['status'] = response.status_code
         if response.status_code == 200:
             self.logger.info(f"Data retrieved for {self.plant} for period {period}")
             return response.json()[0]  ## este endopoint devuelve una lista con un solo elemento
@@ -44,39 +88,47 @@ class Consumer:
 
     def save_json_data(self, data, filename):
         with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
+            if isinstance(data, MeasurementColumns):
+                f.write(data.to_json())
+            else:
+                json.dump(data, f, indent=4)
         self.logger.info(f"Data saved to {filename}")
         return filename
 
-    def format_measurements_data(self, data):
-        formatted_data = []
-
+    def format_measurements(self, data):
         self.logger.info(f"Formatting data for {self.plant}, period {data['period']}, last update "
                         + f"{data['lastReadingDate'].split('+')[0]}")
-        for measurement in data['measurement']:
-            formatted_data.append({
-                'timestamp': measurement['dateRange'].split('.')[0],
-                'act_energy': measurement['channel' + self.channel],
-            })
-        return formatted_data
-
-    def pipeline(self, period, channels="1,2,3,4", output_format='json'):
+        return MeasurementColumns.from_payload(data, self.channel)
+
+    def format_measurements_data(self, data):
+        return self.format_measurements(data).to_records()
+
+    def pipeline(self, period, channels=None, output_format='json'):
         data = self.request_measurements(period, channels)
+        return self.save_measurements(data, period, output_format)
+
+    def save_measurements(self, data, period, output_format='json'):
         if data:
-            data = self.format_measurements_data(data)
+            data = self.format_measurements(data)
             if output_format == 'json':
                 output_path = os.path.join(self.output_path, f'PRMT-{self.plant}-{period}.json')
                 filename = self.save_json_data(data, output_path)
             elif output_format == 'csv':
                 output_path = os.path.join(self.output_path, f'PRMT-{self.plant}-{period}.csv')
                 filename = self.save_csv_data(data, output_path)
+            elif output_format == 'npz':
+                output_path = os.path.join(self.output_path, f'PRMT-{self.plant}-{period}.npz')
+                filename = data.save_npz(output_path)
+                self.logger.info(f"Data saved to {filename}")
+            else:
+                raise ValueError(f"Invalid output format: {output_format}")
             return filename
         return None
 
     def save_csv_data(self, data, filename):
+        if not isinstance(data, MeasurementColumns):
+            data = MeasurementColumns.from_records(data)
         with open(filename, 'w') as f:
-            f.write("timestamp,act_energy\n")
-            for measurement in data:
-                f.write(f"{measurement['timestamp']},{measurement['act_energy']}\n")
+            f.write(data.to_csv())
         self.logger.info(f"Data saved to {filename}")
         return filename
@@ -0,0 +1,126 @@
+import json
+import numpy as np
+
+## Representacion columnar de las medidas del CEN: un arreglo de timestamps y uno de
+## energia. El parseo y la escritura trabajan sobre los arreglos completos en vez de
+## armar un dict por intervalo. La energia es float64 con NaN en los faltantes, mas una
+## mascara de las posiciones que venian como enteros, asi la salida es la misma que antes
+## (12 y no 12.0, None en el csv).
+
+TIMESTAMP_LENGTH = 19  ## 'YYYY-MM-DDTHH:MM:SS' antes de los milisegundos
+
+
+def strip_fraction(date_ranges):
+    ## equivale a dateRange.split('.')[0] para todo el arreglo
+    if not len(date_ranges):
+        return date_ranges.astype(f'U{TIMESTAMP_LENGTH}')
+    dots = np.char.find(date_ranges, '.')
+    if (dots == TIMESTAMP_LENGTH).all():
+        return date_ranges.astype(f'U{TIMESTAMP_LENGTH}')
+    return np.array([date_range.split('.')[0] for date_range in date_ranges.tolist()])
+
+NULLS_PREFIX = '__nulls__'  ## mismo esquema de mascaras que rev_api.DataReaders
+
+
+def energy_column(values):
+    energy = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    integers = np.array([isinstance(value, int) and not isinstance(value, bool) for value in values], dtype=bool)
+    return energy, integers
+
+def energy_values(energy, integers):
+    ## valores de python: int donde venian enteros, None donde falta el dato
+    if integers.all():
+        return energy.astype(np.int64).tolist()
+    values = energy.tolist()
+    for index in np.flatnonzero(integers).tolist():
+        values[index] = int(values[index])
+    for index in np.flatnonzero(np.isnan(energy)).tolist():
+        values[index] = None
+    return values
+
+def energy_strings(energy, integers, null):
+    ## repr de cada valor (igual que json.dumps); los faltantes se escriben como null.
+    ## map(repr) sobre tolist() es mas rapido que energy.astype(str) en numpy
+    text = list(map(repr, energy_values(energy, integers)))
+    for index in np.flatnonzero(np.isnan(energy)).tolist():
+        text[index] = null
+    return text
+
+class MeasurementColumns:
+    def __init__(self, timestamps, energy, integers=None):
+        self.timestamps = timestamps
+        self.energy = energy
+        self.integers = np.zeros(len(energy), dtype=bool) if integers is None else integers
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def from_payload(cls, data, channel):
+        measurements = data['measurement']
+        key = 'channel' + str(channel)
+        date_ranges = np.array([measurement['dateRange'] for measurement in measurements], dtype=str)
+        energy, integers = energy_column([measurement.get(key) for measurement in measurements])
+        return cls(strip_fraction(date_ranges), energy, integers)
+
+    def to_records(self):
+        return [{'timestamp': timestamp, 'act_energy': energy}
+                for timestamp, energy in zip(self.timestamps.tolist(), energy_values(self.energy, self.integers))]
+
+    def to_json(self):
+        row = '{{"timestamp": "{}", "act_energy": {}}}'.format
+        rows = map(row, self.timestamps.tolist(), energy_strings(self.energy, self.integers, 'null'))
+        return '[' + ',\n'.join(rows) + ']'
+
+    def to_csv(self):
+        ## los faltantes quedan como None, igual que el f-string del formato anterior
+        rows = map(','.join, zip(self.timestamps.tolist(), energy_strings(self.energy, self.integers, 'None')))
+        return 'timestamp,act_energy\n' + ''.join(row + '\n' for row in rows)
+
+    def save_json(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.to_json())
+        return filename
+
+    def save_csv(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.to_csv())
+        return filename
+
+    def save_npz(self, filename):
+        ## mismo esquema que rev_api.DataReaders.write_npz: si todos los valores presentes son
+        ## enteros la columna es int64 con su mascara de nulos, si no float64 con NaN
+        nulls = np.isnan(self.energy)
+        columns = {'timestamp': self.timestamps}
+        if self.integers.any() and (self.integers | nulls).all():
+            columns['act_energy'] = np.where(nulls, 0, self.energy).astype(np.int64)
+            if nulls.any():
+                columns[NULLS_PREFIX + 'act_energy'] = nulls
+        else:
+            columns['act_energy'] = self.energy
+        with open(filename, 'wb') as f:
+            np.savez_compressed(f, __columns__=np.array(['timestamp', 'act_energy']), **columns)
+        return filename
+
+    @classmethod
+    def load_npz(cls, filename):
+        with np.load(filename, allow_pickle=False) as data:
+            energy = data['act_energy']
+            if energy.dtype.kind == 'f':
+                return cls(data['timestamp'], energy)
+            if NULLS_PREFIX + 'act_energy' in data.files:
+                nulls = data[NULLS_PREFIX + 'act_energy']
+            else:
+                nulls = np.zeros(len(energy), dtype=bool)
+            return cls(data['timestamp'], np.where(nulls, np.nan, energy.astype(np.float64)), ~nulls)
+
+    @classmethod
+    def from_records(cls, records):
+        timestamps = np.array([record['timestamp'] for record in records], dtype=str)
+        energy, integers = energy_column([record['act_energy'] for record in records])
+        return cls(timestamps, energy, integers)
+
+    @classmethod
+    def load_json(cls, filename):
+        with open(filename, 'r') as f:
+            return cls.from_records(json.load(f))
@@ -0,0 +1,202 @@
+import os, json, time, hashlib, threading, calendar, logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+## Cache en disco de las respuestas del CEN, por punto de medida, periodo y canales.
+## Los meses cerrados se sirven localmente; el mes en curso (o uno recien cerrado, que
+## todavia puede recibir correcciones) se vuelve a pedir cuando la copia tiene mas de TTL.
+## El lastReadingDate de la copia decide cada cuanto: si todavia faltan lecturas del mes se
+## revalida cada TTL, si ya llega al fin del mes solo pueden venir correcciones y se revalida
+## cada CORRECTION_TTL. Cada copia son dos archivos: el payload (.json) y su metadata (.meta),
+## asi una revalidacion que trae lo mismo solo reescribe la metadata y cuenta como hit.
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), 'cache')
+MAX_BYTES = 256 * 1024 * 1024
+TTL = 3600
+CORRECTION_TTL = 24 * 3600
+SETTLE_DAYS = 10
+
+
+def period_end(period):
+    ## periodo YYYYMM010000 -> timestamp del fin de ese mes (UTC)
+    year, month = int(period[:4]), int(period[4:6])
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return calendar.timegm((year, month, 1, 0, 0, 0))
+
+def reading_time(last_reading_date):
+    ## lastReadingDate ISO con offset ('2024-12-01T00:00:00+00:00') -> timestamp, None si no se lee
+    try:
+        return datetime.fromisoformat(last_reading_date).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class ResponseCache:
+    def __init__(self, path=None, max_bytes=None, ttl=None, settle_days=None, correction_ttl=None):
+        self.path = path or os.getenv('PRMT_CACHE_PATH', CACHE_PATH)
+        if max_bytes is None:
+            max_bytes = int(os.getenv('PRMT_CACHE_MAX_BYTES', str(MAX_BYTES)))
+        if ttl is None:
+            ttl = float(os.getenv('PRMT_CACHE_TTL', str(TTL)))
+        if settle_days is None:
+            settle_days = float(os.getenv('PRMT_SETTLE_DAYS', str(SETTLE_DAYS)))
+        if correction_ttl is None:
+            correction_ttl = float(os.getenv('PRMT_CORRECTION_TTL', str(CORRECTION_TTL)))
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.correction_ttl = max(correction_ttl, ttl)
+        self.settle = settle_days * 24 * 3600
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        os.makedirs(self.path, exist_ok=True)
+
+    def key_path(self, point, period, channels):
+        key = hashlib.sha256(f"{point}:{period}:{channels}".encode()).hexdigest()[:32]
+        return os.path.join(self.path, f"{key}.json")
+
+    def meta_path(self, path):
+        return path[:-len('.json')] + '.meta'
+
+    def closed(self, entry):
+        ## un mes esta cerrado si la copia se reviso pasado el plazo de correcciones
+        return entry['checked_at'] >= period_end(entry['period']) + self.settle
+
+    def complete(self, entry):
+        ## la copia ya tiene la ultima lectura del mes
+        last_reading = reading_time(entry.get('lastReadingDate'))
+        return last_reading is not None and last_reading >= period_end(entry['period'])
+
+    def fresh(self, entry):
+        if self.closed(entry):
+            return True
+        ttl = self.correction_ttl if self.complete(entry) else self.ttl
+        return time.time() - entry['checked_at'] < ttl
+
+    def read_meta(self, path):
+        try:
+            with open(self.meta_path(path), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def write_file(self, path, value):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+        return
+
+    def get(self, point, period, channels):
+        ## devuelve (metadata, payload, fresh); (None, None, False) si no hay copia
+        path = self.key_path(point, period, channels)
+        entry = self.read_meta(path)
+        if entry is None:
+            return None, None, False
+        try:
+            with open(path, 'r') as f:
+                payload = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None, None, False
+        try:
+            os.utime(path)  ## el mtime marca el ultimo acceso para la eviccion LRU
+        except FileNotFoundError:
+            pass
+        return entry, payload, self.fresh(entry)
+
+    def put(self, point, period, channels, payload):
+        now = time.time()
+        entry = {
+            'point': point,
+            'period': period,
+            'channels': channels,
+            'lastReadingDate': payload.get('lastReadingDate'),
+            'fetched_at': now,
+            'checked_at': now,
+        }
+        path = self.key_path(point, period, channels)
+        self.write_file(path, payload)
+        self.write_file(self.meta_path(path), entry)
+        self.evict()
+        return
+
+    def touch(self, point, period, channels, entry):
+        ## revalidacion sin cambios: el payload queda como esta, solo se anota la revision
+        entry = {**entry, 'checked_at': time.time()}
+        self.write_file(self.meta_path(self.key_path(point, period, channels)), entry)
+        return
+
+    def evict(self):
+        with self.lock:
+            files = []
+            for name in os.listdir(self.path):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in files)
+            for _, size, name in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                path = os.path.join(self.path, name)
+                for evicted in [path, self.meta_path(path)]:
+                    try:
+                        os.remove(evicted)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                self.evictions += 1
+        return
+
+    def fetch(self, point, period, channels, request):
+        ## request() hace la llamada al CEN; si falla y hay una copia vieja se usa esa.
+        ## Una revalidacion con el mismo lastReadingDate y las mismas lecturas cuenta como hit
+        entry, payload, fresh = self.get(point, period, channels)
+        if fresh:
+            with self.lock:
+                self.hits += 1
+            return payload
+        data = request()
+        if payload is not None:
+            with self.lock:
+                self.revalidations += 1
+        if data is None:
+            if payload is not None:
+                logger.warning(f"Using stale cached data for {point}, period {period}")
+            with self.lock:
+                self.misses += 1
+            return payload
+        if payload is not None and entry.get('lastReadingDate') == data.get('lastReadingDate') and payload == data:
+            logger.debug(f"Cached data for {point}, period {period} unchanged")
+            self.touch(point, period, channels, entry)
+            with self.lock:
+                self.hits += 1
+            return payload
+        with self.lock:
+            self.misses += 1
+        self.put(point, period, channels, data)
+        return data
+
+    def stats(self):
+        ## cada fetch es un hit o un miss; revalidations cuenta los que volvieron al CEN con copia
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / requests, 3) if requests else 0.0,
+            }
+
+    def log_stats(self, log=None):
+        stats = self.stats()
+        (log or logger).info(f"CEN cache: {stats['hits']} hits, {stats['misses']} misses, "
+                             f"{stats['revalidations']} revalidated, {stats['evictions']} evicted")
+        return stats
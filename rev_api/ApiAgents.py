@@ -1,6 +1,15 @@
-import os, requests, json
+import os, requests, json, threading, time, random, base64, gzip
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
-from urllib.parse import urljoin
+from urllib.parse import parse_qsl, urlencode
+from datetime import date, timedelta
+from requests.adapters import HTTPAdapter
+from .DataReaders import RawRecords, detect_format, write_npz
+from .MetadataCache import MetadataCache, INVALIDATES, cached_metadata
+from .Routes import API_ROUTES, ADMIN_ROUTES, add_endpoint_methods
+from .Metrics import METRICS, body_size
+from .ChunkBudgets import ChunkBudgets
+from utils.Tracing import span
 import logging
 
 ENV_FILE = 'prod.env'
@@ -20,10 +29,222 @@ class RefreshFailedException(Exception):
 class TokenExpiredException(Exception):
     pass
 
-## Clases que implementan los endpoints de la API
+class RangeFetchFailedException(Exception):
+    pass
+
+RETRY_STATUS = [500, 502, 503, 504]
+COMPRESSION_REJECTED_STATUS = [415]  ## Unsupported Media Type: el servidor no acepta el gzip
+
+## Utilidades para las subidas por chunks
+
+class Chunk(list):
+    ## lista de registros serializados, start es la posicion del primero en el archivo
+    def __init__(self, start, items=()):
+        super().__init__(items)
+        self.start = start
+
+def backoff_delay(attempt, base=None, cap=30.0):
+    if base is None:
+        base = float(os.getenv('RETRY_BACKOFF', '0.5'))
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def as_records(data):
+    if isinstance(data, (str, bytes)):
+        return json.loads(data)
+    return data
+
+class UploadProgress:
+    ## avance para los logs de cada parte: total de partes si se conoce de antemano,
+    ## y filas subidas sobre el total de filas a subir cuando se puede contar barato
+    def __init__(self, total_parts=None, total_rows=None):
+        self.total_parts = total_parts
+        self.total_rows = total_rows
+        self.rows = 0
+        self.lock = threading.Lock()
+
+    def part(self, part):
+        return f"{part}/{self.total_parts or '?'}"
+
+    def advance(self, rows):
+        with self.lock:
+            self.rows += rows
+            done = self.rows
+        if self.total_rows is None:
+            return f"{done} rows so far"
+        return f"{done}/{self.total_rows} rows"
+
+def prepare_chunks(data, chunk_size=None, chunk_bytes=None, checkpoint=None):
+    ## data puede ser un string JSON, un iterable de registros o RawRecords ya serializados;
+    ## cada registro se serializa a lo mas una vez y los chunks se arman uniendo los textos.
+    ## Si los registros ya estan en memoria los chunks se arman de antemano, asi se conoce el
+    ## total de partes; los archivos se siguen leyendo de a poco. Devuelve (chunks, progreso)
+    acked = checkpoint.acked_rows() if checkpoint is not None else 0
+    if isinstance(data, RawRecords):
+        total_rows = data.rows - acked if data.rows is not None else None
+        return split_chunks(data, chunk_size, chunk_bytes, checkpoint), UploadProgress(total_rows=total_rows)
+    records = as_records(data)
+    if not hasattr(records, '__len__'):
+        items = (json.dumps(record) for record in records)
+        return split_chunks(items, chunk_size, chunk_bytes, checkpoint), UploadProgress()
+    chunks = list(split_chunks([json.dumps(record) for record in records], chunk_size, chunk_bytes, checkpoint))
+    return iter(chunks), UploadProgress(len(chunks), len(records) - acked)
+
+def split_chunks(items, chunk_size=None, chunk_bytes=None, checkpoint=None):
+    ## corta por cantidad de filas, por bytes serializados o por lo que ocurra primero;
+    ## las filas ya confirmadas en el checkpoint se saltan y cortan el chunk
+    chunk = Chunk(0)
+    size = 2
+    for index, item in enumerate(items):
+        if checkpoint is not None and checkpoint.is_acked(index):
+            if chunk:
+                yield chunk
+            chunk = Chunk(index + 1)
+            size = 2
+            continue
+        if chunk and chunk_bytes is not None and size + len(item) + 1 > chunk_bytes:
+            yield chunk
+            chunk = Chunk(index)
+            size = 2
+        chunk.append(item)
+        size += len(item) + 1
+        if chunk_size is not None and len(chunk) == chunk_size:
+            yield chunk
+            chunk = Chunk(index + 1)
+            size = 2
+    if chunk:
+        yield chunk
+
+def count_parts(progress, generated, chunks):
+    ## partes totales para el resumen; si se detuvo antes de tiempo, las que no se alcanzaron a
+    ## generar se cuentan recorriendo el resto de los chunks (sin subir nada) y quedan canceladas
+    if progress.total_parts is None:
+        progress.total_parts = generated + sum(1 for _ in chunks)
+    return progress.total_parts
+
+def chunk_body(items):
+    return '[' + ','.join(items) + ']'
+
+def compress_body(data, level):
+    ## devuelve (body sin comprimir en bytes, body gzip)
+    raw = data.encode() if isinstance(data, str) else data
+    return raw, gzip.compress(raw, compresslevel=level)
+
+def summarize_chunks(label, results, total_parts, checkpoint=None):
+    sent_parts = {result['part'] for result in results}
+    for part in range(1, total_parts + 1):
+        if part not in sent_parts:
+            results.append({'part': part, 'status': 'cancelled'})
+    results.sort(key=lambda result: result['part'])
+    uploaded = sum(1 for result in results if result['status'] == 'success')
+    failed = sum(1 for result in results if result['status'] == 'error')
+    summary = {
+        'status': 'error' if failed or uploaded < total_parts else 'success',
+        'parts': total_parts,
+        'uploaded': uploaded,
+        'failed': failed,
+        'cancelled': len(results) - uploaded - failed,
+        'rows': sum(result.get('rows', 0) for result in results if result['status'] == 'success'),
+        'bytes': sum(result.get('bytes', 0) for result in results),
+        'splits': sum(result.get('splits', 0) for result in results),
+        'retries': sum(result.get('retries', 0) for result in results),
+        'sent_bytes': sum(result.get('sent_bytes', 0) for result in results),
+        'chunks': results,
+    }
+    if checkpoint is not None:
+        summary['skipped_rows'] = checkpoint.acked_rows() - summary['rows']
+        if summary['status'] == 'success':
+            checkpoint.clear()
+    if summary['status'] == 'error':
+        logger.error(f"{label}: {uploaded}/{total_parts} parts uploaded, {failed} failed, "
+                     f"{summary['cancelled']} cancelled.")
+    return summary
+
+## Utilidades para las descargas por rango de fechas
+
+WINDOW_DAYS = {'day': 1, 'week': 7}
+
+def window_days(window):
+    if window is None:
+        window = os.getenv('RANGE_WINDOW', 'week')
+    if isinstance(window, str) and window in WINDOW_DAYS:
+        return WINDOW_DAYS[window]
+    days = int(window)
+    if days < 1:
+        raise ValueError(f"Invalid window: {window}")
+    return days
+
+def split_range(start_date, end_date, window=None):
+    ## ventanas [inicio, fin] de window dias que cubren start_date..end_date. El servidor incluye
+    ## el end_date, asi que cada ventana parte el dia siguiente al fin de la anterior y un rango
+    ## de un solo dia es una ventana. Los limites son fechas (YYYY-MM-DD): si start_date/end_date
+    ## traen hora se toma solo el dia, asi ninguna ventana mezcla una fecha con un datetime
+    days = window_days(window)
+    start, end = date.fromisoformat(start_date[:10]), date.fromisoformat(end_date[:10])
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=days - 1), end)
+        windows.append((start.isoformat(), window_end.isoformat()))
+        start = window_end + timedelta(days=1)
+    return windows
+
+def range_query(query_params, start_date, end_date):
+    ## mismo query string con otro start_date/end_date, el resto de los parametros se mantiene
+    params = dict(parse_qsl(query_params.lstrip('?')))
+    params['start_date'] = start_date
+    params['end_date'] = end_date
+    return '?' + urlencode(params)
+
+def write_records(records, output_path):
+    ## escribe el stream de registros segun la extension, sin juntarlo en memoria salvo para npz
+    data_format = detect_format(output_path)
+    if data_format == 'npz':
+        return write_npz(output_path, records)
+    with open(output_path, 'w') as f:
+        if data_format == 'ndjson':
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+            return output_path
+        f.write('[')
+        for index, record in enumerate(records):
+            f.write((',\n' if index else '') + json.dumps(record))
+        f.write(']')
+    return output_path
+
+## Manejo de credenciales y tokens guardados en config.json, compartido por los agentes
+
+def token_expiry(token):
+    ## lee el claim exp del JWT sin verificar la firma, None si no se puede leer
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+class AgentConfig:
+    ROUTES = API_ROUTES
+
+    def init_routes(self):
+        ## las URLs de la tabla de rutas se compilan una sola vez por agente
+        base_url = os.getenv('BASE_URL')
+        self.routes = {route.name: route for route in self.ROUTES}
+        self.urls = {route.name: route.compile(base_url) for route in self.ROUTES}
+        return
+
+    def url(self, name, **values):
+        template = self.urls[name]
+        if template is None:
+            raise ValueError(f"Endpoint {self.routes[name].env} is not configured")
+        return template.format(**values)
 
-class APIAgent:
-    def __init__(self, prefix='API_'):
+    def route_headers(self, route):
+        headers = {'Authorization': f'Bearer {self.access_token}'} if route.auth else {}
+        if route.json_body:
+            headers['content-type'] = 'application/json'
+        return headers
+
+    def load_config(self, prefix):
         self.username = os.getenv(prefix+'USERNAME')
         self.password = os.getenv(prefix+'PASSWORD')
         self.config_path = os.path.join(os.path.dirname(__file__), 'config.json')
@@ -45,7 +266,54 @@ class APIAgent:
             self.access_token = ''
             self.refresh_token = ''
         return
-    
+
+    def token_state(self, token=None):
+        if token is None:
+            token = self.access_token
+        if not token:
+            return 'expired'
+        expiry = token_expiry(token)
+        if expiry is None:
+            return 'unknown'
+        remaining = expiry - time.time()
+        if remaining <= 0:
+            return 'expired'
+        if remaining <= float(os.getenv('TOKEN_REFRESH_MARGIN', '300')):
+            return 'expiring'
+        return 'fresh'
+
+    def init_compression(self, compression=None, compression_level=None):
+        ## gzip de los bodies de escritura masiva, opt-in con REQUEST_COMPRESSION=gzip
+        if compression is None:
+            compression = os.getenv('REQUEST_COMPRESSION', '').lower() in ['gzip', 'true', '1', 'yes']
+        if compression_level is None:
+            compression_level = int(os.getenv('REQUEST_COMPRESSION_LEVEL', '6'))
+        self.compression = compression
+        self.compression_level = min(max(compression_level, 1), 9)
+        self.uncompressed_endpoints = set()
+        return
+
+    def compress_for(self, endpoint):
+        return self.compression and endpoint not in self.uncompressed_endpoints
+
+    def reject_compression(self, label, endpoint, status):
+        if endpoint not in self.uncompressed_endpoints:
+            self.uncompressed_endpoints.add(endpoint)
+            logger.warning(f"{label}: Server rejected gzip body (status {status}), "
+                           f"sending {endpoint} uncompressed from now on.")
+        return
+
+    def chunk_budget(self, endpoint, chunk_bytes=None):
+        if chunk_bytes is not None:
+            return chunk_bytes
+        return self.chunk_budgets.get(endpoint)
+
+    def remember_chunk_budget(self, label, endpoint, results, chunk_bytes=None):
+        ## solo se aprende del tamano por defecto, no de un chunk_bytes dado explicitamente
+        if chunk_bytes is None:
+            self.chunk_budgets.learn(label, endpoint, results)
+        return
+
     def init_config(self):
         with open(self.config_path, 'w') as f:
             f.write(json.dumps(
@@ -68,12 +336,250 @@ class APIAgent:
         with open(self.config_path, 'w') as f:
             f.write(json.dumps(data, indent=4))
         return
-    
+
+## Clases que implementan los endpoints de la API
+
+class APIAgent(AgentConfig):
+    def __init__(self, prefix='API_', pool_size=None, keep_alive=None, upload_workers=None,
+                 compression=None, compression_level=None, metadata_cache=None, metrics=None):
+        self.load_config(prefix)
+        self.chunk_budgets = ChunkBudgets()
+        self.init_routes()
+        self.metrics = metrics if metrics is not None else METRICS
+        self.init_compression(compression, compression_level)
+        if metadata_cache is None and os.getenv('METADATA_CACHE', 'true').lower() not in ['false', '0', 'no']:
+            metadata_cache = MetadataCache()
+        self.metadata_cache = metadata_cache or None
+        if upload_workers is None:
+            upload_workers = int(os.getenv('UPLOAD_WORKERS', '1'))
+        self.upload_workers = max(upload_workers, 1)
+        self.max_retries = int(os.getenv('UPLOAD_RETRIES', '4'))
+        self.session = self.init_session(pool_size, keep_alive)
+        return
+
+    def init_session(self, pool_size=None, keep_alive=None):
+        if pool_size is None:
+            pool_size = int(os.getenv('POOL_SIZE', '10'))
+        pool_size = max(pool_size, self.upload_workers)
+        if keep_alive is None:
+            keep_alive = os.getenv('KEEP_ALIVE', 'true').lower() not in ['false', '0', 'no']
+        session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', self.adapter)
+        session.mount('https://', self.adapter)
+        ## solo se controla si se reusan las conexiones; cuanto duran abiertas lo decide el servidor
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def close(self):
+        self.session.close()
+        return
+
+    def connection_stats(self):
+        ## urllib3 lleva la cuenta de requests y conexiones abiertas por cada pool
+        requests_sent = 0
+        connections_opened = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_sent += pool.num_requests
+            connections_opened += pool.num_connections
+        return {
+            'requests': requests_sent,
+            'connections': connections_opened,
+            'reused': max(requests_sent - connections_opened, 0),
+        }
+
+    def log_connection_reuse(self, label, before):
+        after = self.connection_stats()
+        sent = after['requests'] - before['requests']
+        opened = after['connections'] - before['connections']
+        logger.info(f"{label}: {sent} requests, {max(sent - opened, 0)} on reused connections, "
+                    f"{opened} new connections.")
+        return
+
+    def request(self, method, endpoint, PATH, headers=None, data=None):
+        ## todos los requests HTTP del agente salen por aca: quedan registrados en self.metrics
+        ## y, con tracing activado, como span dentro de la etapa que los hizo
+        with span(endpoint, 'http', method=method) as trace_args:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, PATH, headers=headers, data=data)
+            except requests.RequestException as e:
+                self.metrics.record(endpoint, method, type(e).__name__, time.perf_counter() - start,
+                                    body_size(data))
+                raise
+            self.metrics.record(endpoint, method, response.status_code, time.perf_counter() - start,
+                                body_size(data), len(response.content))
+            trace_args['status'] = response.status_code
+        return response
+
+    def call(self, name, *args, **kwargs):
+        ## ejecutor comun de los endpoints: arma la URL desde la tabla de rutas, envia y
+        ## traduce el status code segun la ruta; None si la respuesta no es la esperada
+        route = self.routes[name]
+        values, data = route.bind(args, kwargs)
+        PATH = self.url(name, **values)
+        if route.compress:
+            response, _ = self.send_json(route.method, route.label, route.env, PATH, data)
+        else:
+            response = self.request(route.method, route.env, PATH, self.route_headers(route), data)
+        if name in INVALIDATES:
+            self.invalidate_metadata(name)
+        if response.status_code in route.ok and route.message is not None:
+            return {'message': route.message}
+        if response.status_code in route.ok or response.status_code in route.passthrough:
+            return response.json()
+        if route.error is not None:
+            try:
+                logger.error(response.json())
+            except ValueError:
+                logger.error(f"Unknown error while {route.error}")
+        return None
+
+    def invalidate_metadata(self, operation):
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate_after(operation)
+        return
+
+    def send_json(self, method, label, endpoint, PATH, data):
+        ## envia un body JSON, con gzip si esta activado; si el servidor rechaza el body
+        ## comprimido se reenvia sin comprimir y el endpoint queda sin compresion.
+        ## Devuelve (response, bytes enviados)
+        headers = {'Authorization': f'Bearer {self.access_token}',
+                   'content-type': 'application/json'}
+        if not self.compress_for(endpoint):
+            return self.request(method, endpoint, PATH, headers, data), len(data)
+        raw, body = compress_body(data, self.compression_level)
+        response = self.request(method, endpoint, PATH, {**headers, 'Content-Encoding': 'gzip'}, body)
+        if response.status_code not in COMPRESSION_REJECTED_STATUS:
+            return response, len(body)
+        fallback = self.request(method, endpoint, PATH, headers, raw)
+        if fallback.status_code not in COMPRESSION_REJECTED_STATUS:
+            self.reject_compression(label, endpoint, response.status_code)
+        return fallback, len(raw)
+
+    def post_chunk(self, label, endpoint, PATH, chunk_data, result):
+        ## reintenta errores 5xx y de conexion con backoff exponencial y jitter
+        attempt = 0
+        while True:
+            try:
+                response, sent = self.send_json('POST', label, endpoint, PATH, chunk_data)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                error = type(e).__name__
+            else:
+                if response.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    return response, sent
+                error = f"status code {response.status_code}"
+            delay = backoff_delay(attempt)
+            attempt += 1
+            result['retries'] += 1
+            self.metrics.record_retry(endpoint)
+            logger.warning(f"{label}: Part {result['part']} failed with {error}, "
+                           f"retrying in {delay:.1f}s ({attempt}/{self.max_retries}).")
+            time.sleep(delay)
+
+    def upload_chunk(self, label, endpoint, PATH, part, progress, chunk, stop_event, checkpoint=None):
+        result = {'part': part, 'start': chunk.start, 'rows': len(chunk), 'bytes': 0,
+                  'sent_bytes': 0, 'splits': 0, 'retries': 0}
+        if stop_event.is_set():
+            result['status'] = 'cancelled'
+            return result
+        start = time.perf_counter()
+        pending = [chunk]
+        while pending:
+            chunk = pending.pop(0)
+            chunk_data = chunk_body(chunk)
+            try:
+                response, sent = self.post_chunk(label, endpoint, PATH, chunk_data, result)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                stop_event.set()
+                result['status'] = 'error'
+                result['elapsed'] = round(time.perf_counter() - start, 3)
+                logger.error(f"{label}: Failed to upload part {progress.part(part)}: {e}")
+                return result
+            result['status_code'] = response.status_code
+            if response.status_code == 201:
+                result['bytes'] += len(chunk_data)
+                result['sent_bytes'] += sent
+                result['max_bytes'] = max(result.get('max_bytes', 0), len(chunk_data))
+                if checkpoint is not None:
+                    checkpoint.ack(chunk.start, chunk.start + len(chunk))
+                continue
+            if response.status_code == 413 and len(chunk) > 1:
+                ## se parte el chunk en dos y se reintentan las mitades
+                half = len(chunk) // 2
+                logger.warning(f"{label}: Part {part} too large ({len(chunk)} rows, {len(chunk_data)} bytes), "
+                               f"splitting it in two.")
+                pending[:0] = [Chunk(chunk.start, chunk[:half]), Chunk(chunk.start + half, chunk[half:])]
+                result['splits'] += 1
+                continue
+            stop_event.set()
+            result['status'] = 'error'
+            result['elapsed'] = round(time.perf_counter() - start, 3)
+            if response.status_code in [400, 413]:
+                try:
+                    logger.error(response.json())
+                except ValueError:
+                    logger.error(response.text)
+                if response.status_code == 413:
+                    logger.error(f"{label}: Payload too large, a single record exceeds the server limit.")
+            else:
+                logger.error(f"{label}: Failed to upload part {progress.part(part)}. "
+                             f"Status code: {response.status_code}")
+            return result
+        result['elapsed'] = round(time.perf_counter() - start, 3)
+        logger.info(f"{label}: Part {progress.part(part)} uploaded successfully "
+                    f"({progress.advance(result['rows'])}, {result['bytes']} bytes, {result['sent_bytes']} sent).")
+        result['status'] = 'success'
+        return result
+
+    def upload_chunks(self, label, endpoint, PATH, chunks, progress, max_workers=None, checkpoint=None,
+                      chunk_bytes=None):
+        ## sube los chunks con a lo mas max_workers requests en vuelo, deteniendose en el primer error
+        if checkpoint is not None and checkpoint.acked_rows():
+            logger.info(f"{label}: Resuming upload from row {checkpoint.first_unacked()}, "
+                        f"{checkpoint.acked_rows()} rows already acknowledged.")
+        if max_workers is None:
+            max_workers = self.upload_workers
+        max_workers = max(int(max_workers), 1)
+        stats = self.connection_stats()
+        stop_event = threading.Event()
+        results = []
+        generated = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            for part, chunk in enumerate(chunks, start=1):
+                generated = part
+                if stop_event.is_set():
+                    break
+                if len(pending) >= max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results.extend(future.result() for future in done)
+                    if stop_event.is_set():
+                        break
+                pending.add(executor.submit(self.upload_chunk, label, endpoint, PATH, part, progress,
+                                            chunk, stop_event, checkpoint))
+            done, _ = wait(pending)
+            results.extend(future.result() for future in done)
+        self.log_connection_reuse(label, stats)
+        self.remember_chunk_budget(label, endpoint, results, chunk_bytes)
+        summary = summarize_chunks(label, results, count_parts(progress, generated, chunks), checkpoint)
+        summary['reused_connections'] = self.connection_stats()['reused'] - stats['reused']
+        if self.compression and summary['bytes']:
+            logger.info(f"{label}: {summary['bytes']} bytes sent as {summary['sent_bytes']} "
+                        f"({summary['bytes'] / max(summary['sent_bytes'], 1):.1f}x).")
+        return summary
+
     def login(self):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('LOGIN'))
         logger.debug('Logging in')
-        response = requests.post(PATH, data={'username': self.username,
-                                        'password': self.password})
+        response = self.request('POST', 'LOGIN', self.url('login'), data={'username': self.username,
+                                                                          'password': self.password})
         if response.status_code == 200:
             logger.debug('Login successful')
             response_json = response.json()
@@ -89,9 +595,10 @@ class APIAgent:
         return
     
     def refresh(self):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('REFRESH'))
+        if self.token_state(self.refresh_token) == 'expired':
+            raise RefreshFailedException('Refresh token is expired')
         logger.debug('Refreshing token')
-        response = requests.post(PATH, data={'refresh': self.refresh_token})
+        response = self.request('POST', 'REFRESH', self.url('refresh'), data={'refresh': self.refresh_token})
         if response.status_code == 200:
             logger.debug('Token refresh successful')
             response_json = response.json()
@@ -104,9 +611,8 @@ class APIAgent:
         return
 
     def validate(self):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('VALIDATE'))
         logger.debug('Validating token')
-        response = requests.get(PATH, headers={
+        response = self.request('GET', 'VALIDATE', self.url('validate'), headers={
                                 'Authorization': f'Bearer {self.access_token}'})
         if response.status_code == 200:
             logger.debug('Token is valid')
@@ -115,8 +621,16 @@ class APIAgent:
         return
 
     def auth(self):
+        ## solo se valida contra el servidor si no se puede leer la expiracion del token
+        state = self.token_state()
+        if state == 'fresh':
+            logger.debug('Token is fresh, skipping validation')
+            return True
         try:
-            self.validate()
+            if state == 'unknown':
+                self.validate()
+            else:
+                raise TokenExpiredException(f'Token is {state}')
         except TokenExpiredException:
             try:
                 self.refresh()
@@ -129,546 +643,123 @@ class APIAgent:
         logger.debug('Authentication successful')
         return True
 
-    def plant_detail(self, plant_id):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('PLANT_DETAIL')).replace('?plant', plant_id)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def portfolio_detail(self, portfolio_id):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('PORTFOLIO_DETAIL')).replace('?portfolio', portfolio_id)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def get_user_plants_access(self):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GET_USER_PLANTS_ACCESS'))
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def get_user_portfolios_access(self, detailed=False):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GET_USER_PORTFOLIOS_ACCESS')
-                       ).replace('?query_params', f'?detailed={detailed}')
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def get_portfolio_plants(self, portfolio_id, detailed=False):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GET_PORTFOLIO_PLANTS')
-                       ).replace('?portfolio', portfolio_id).replace('?query_params', f'?detailed={detailed}')
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def get_gen_measurements(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GET_GEN_MEAS')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        else:
-            try:
-                logger.error(response.json())
-            except:
-                logger.error("Unknown error while getting gen measurements")
-        return None
-
-    def get_weather_measurements(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GET_WEATHER_MEAS')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        else:
-            try:
-                logger.error(response.json())
-            except:
-                logger.error("Unknown error while getting weather measurements")
-        return None
-
-    def post_gen_measurements(self, plant_id, data, chunk_size=500):
-        data_list = json.loads(data)
-        total_parts = (len(data_list) + chunk_size - 1) // chunk_size
-
-        for i in range(total_parts):
-            chunk = data_list[i*chunk_size : (i+1)*chunk_size]
-            chunk_data = json.dumps(chunk)
-
-            PATH = urljoin(os.getenv('BASE_URL'), os.getenv('POST_GEN_MEAS')).replace('?plant', plant_id)
-            response = requests.post(PATH, headers={
-                                        'Authorization': f'Bearer {self.access_token}',
-                                        'content-type': 'application/json'}, data=chunk_data)
-
-            if response.status_code == 201:
-                response_json = response.json()
-                logger.info(f"Gen: Part {i+1}/{total_parts} uploaded successfully.")
-            elif response.status_code == 400:
-                logger.error(response.json())
-                return None
-            elif response.status_code == 413:
-                logger.error(response.json())
-                logger.error("Gen: Payload too large. Consider reducing the chunk size.")
-                return None
-            else:
-                logger.error(f"Gen: Failed to upload part {i+1}/{total_parts}. Status code: {response.status_code}")
-                return None
-        return True
-
-    def post_weather_measurements(self, plant_id, data, chunk_size=500):
-        data_list = json.loads(data)
-        total_parts = (len(data_list) + chunk_size - 1) // chunk_size
-
-        for i in range(total_parts):
-            chunk = data_list[i*chunk_size : (i+1)*chunk_size]
-            chunk_data = json.dumps(chunk)
-            PATH = urljoin(os.getenv('BASE_URL'), os.getenv('POST_WEATHER_MEAS')).replace('?plant', plant_id)
-            response = requests.post(PATH, headers={
-                                        'Authorization': f'Bearer {self.access_token}',
-                                        'content-type': 'application/json'}, data=chunk_data)
-
-            if response.status_code == 201:
-                logger.info(f"Weather: Part {i+1}/{total_parts} uploaded successfully.")
-            elif response.status_code == 400:
-                logger.error(response.json())
-                return None
-            elif response.status_code == 413:
-                logger.error("Weather: Payload too large. Consider reducing the chunk size.")
-                return None
-            else:
-                logger.error(f"Weather: Failed to upload part {i+1}/{total_parts}. Status code: {response.status_code}")
-                return None
-        return True
-
-    def update_gen_measurement(self, plant_id, data):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('UPDATE_GEN_MEAS')).replace('?plant', plant_id)
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}',
-                                'content-type': 'application/json'}, data=data)
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def update_weather_measurement(self, plant_id, data):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('UPDATE_WEATHER_MEAS')
-                       ).replace('?plant', plant_id)
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}',
-                                'content-type': 'application/json'}, data=data)
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def get_incidents(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GET_INCIDENTS')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def post_incidents(self, plant_id, table, data, chunk_size=500):
-        data_list = json.loads(data)
-        total_parts = (len(data_list) + chunk_size - 1) // chunk_size
-
-        for i in range(total_parts):
-            chunk = data_list[i*chunk_size : (i+1)*chunk_size]
-            chunk_data = json.dumps(chunk)
-
-            PATH = urljoin(os.getenv('BASE_URL'), os.getenv('POST_INCIDENTS')
-                           ).replace('?plant', plant_id).replace('?table', table)
-            response = requests.post(PATH, headers={
-                                    'Authorization': f'Bearer {self.access_token}',
-                                    'content-type': 'application/json'}, data=chunk_data)
-            if response.status_code == 201:
-                logger.info(f"Incidents: Part {i+1}/{total_parts} uploaded successfully.")
-            elif response.status_code == 400:
-                logger.error(response.json())
-                return None
-            elif response.status_code == 413:
-                logger.error("Incidents: Payload too large. Consider reducing the chunk size.")
-                return None
-            else:
-                logger.error(f"Incidents: Failed to upload part {i+1}/{total_parts}. Status code: {response.status_code}")
-                return None
-        return True
+    def iter_measurements_range(self, method_str, plant_id, start_date, end_date, query_params='',
+                                window=None, max_workers=None):
+        ## parte el rango en ventanas, las pide en paralelo (a lo mas max_workers en vuelo)
+        ## y entrega los registros en orden de timestamp a medida que llegan las ventanas
+        windows = split_range(start_date, end_date, window)
+        if max_workers is None:
+            max_workers = int(os.getenv('RANGE_WORKERS', '4'))
+        max_workers = max(int(max_workers), 1)
+        method = getattr(self, method_str)
+        edge = []  ## registros del ultimo timestamp de la ventana anterior
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for index in range(min(max_workers, len(windows))):
+                futures[index] = executor.submit(method, plant_id, range_query(query_params, *windows[index]))
+            for index, (window_start, window_end) in enumerate(windows):
+                records = futures.pop(index).result()
+                following = index + max_workers
+                if following < len(windows):
+                    futures[following] = executor.submit(
+                        method, plant_id, range_query(query_params, *windows[following]))
+                if records is None:
+                    for future in futures.values():
+                        future.cancel()
+                    raise RangeFetchFailedException(
+                        f"{method_str} failed for window {window_start} - {window_end}")
+                logger.debug(f"{method_str}: window {window_start} - {window_end}, {len(records)} records")
+                records.sort(key=lambda record: record['timestamp'])
+                for record in records:
+                    ## varias filas pueden compartir timestamp (ej. varios inversores); solo se
+                    ## descarta una fila identica a una del borde de la ventana anterior
+                    if edge and record['timestamp'] == edge[0]['timestamp'] and record in edge:
+                        continue
+                    yield record
+                if records:
+                    edge = [record for record in records if record['timestamp'] == records[-1]['timestamp']]
+
+    def get_measurements_range(self, method_str, plant_id, start_date, end_date, query_params='',
+                               window=None, max_workers=None, output_path=None):
+        ## lista con todos los registros, o el path del archivo si se da output_path; None si falla
+        records = self.iter_measurements_range(method_str, plant_id, start_date, end_date, query_params,
+                                               window, max_workers)
+        try:
+            if output_path is not None:
+                return write_records(records, output_path)
+            return list(records)
+        except RangeFetchFailedException as e:
+            logger.error(e)
+            return None
+
+    def get_gen_measurements_range(self, plant_id, start_date, end_date, query_params='', window=None,
+                                   max_workers=None, output_path=None):
+        return self.get_measurements_range('get_gen_measurements', plant_id, start_date, end_date,
+                                           query_params, window, max_workers, output_path)
+
+    def get_weather_measurements_range(self, plant_id, start_date, end_date, query_params='', window=None,
+                                       max_workers=None, output_path=None):
+        return self.get_measurements_range('get_weather_measurements', plant_id, start_date, end_date,
+                                           query_params, window, max_workers, output_path)
+
+    def get_prmt_measurements_range(self, plant_id, start_date, end_date, query_params='', window=None,
+                                    max_workers=None, output_path=None):
+        return self.get_measurements_range('get_prmt_measurements', plant_id, start_date, end_date,
+                                           query_params, window, max_workers, output_path)
+
+    def post_gen_measurements(self, plant_id, data, chunk_size=None, max_workers=None,
+                              chunk_bytes=None, checkpoint=None):
+        PATH = self.url('post_gen_measurements', plant=plant_id)
+        chunks, progress = prepare_chunks(data, chunk_size, self.chunk_budget('POST_GEN_MEAS', chunk_bytes),
+                                          checkpoint)
+        return self.upload_chunks('Gen', 'POST_GEN_MEAS', PATH, chunks, progress, max_workers, checkpoint,
+                                  chunk_bytes)
+
+    def post_weather_measurements(self, plant_id, data, chunk_size=None, max_workers=None,
+                                  chunk_bytes=None, checkpoint=None):
+        PATH = self.url('post_weather_measurements', plant=plant_id)
+        chunks, progress = prepare_chunks(data, chunk_size, self.chunk_budget('POST_WEATHER_MEAS', chunk_bytes),
+                                          checkpoint)
+        return self.upload_chunks('Weather', 'POST_WEATHER_MEAS', PATH, chunks, progress, max_workers, checkpoint,
+                                  chunk_bytes)
+
+    def post_incidents(self, plant_id, table, data, chunk_size=None, max_workers=None,
+                       chunk_bytes=None, checkpoint=None):
+        PATH = self.url('post_incidents', plant=plant_id, table=table)
+        chunks, progress = prepare_chunks(data, chunk_size, self.chunk_budget('POST_INCIDENTS', chunk_bytes),
+                                          checkpoint)
+        return self.upload_chunks('Incidents', 'POST_INCIDENTS', PATH, chunks, progress, max_workers,
+                                  checkpoint, chunk_bytes)
 
     ## export and import might be implemented
 
-    def get_hper(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GET_HPER')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def generate_hper(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GENERATE_HPER')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def generate_hper_result(self, plant_id, task_id):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GENERATE_HPER_RESULT')
-                       ).replace('?plant', plant_id)
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'}, data={"task_id": task_id})
-        if response.status_code == 201:
-            response_json = response.json()
-            return response_json
-        elif response.status_code in [400, 404, 500, 202]:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def get_daily_availability(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GET_DAILY_AVAI')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def generate_daily_availability(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GENERATE_DAILY_AVAI')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def generate_daily_availability_result(self, plant_id, task_id):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GENERATE_DAILY_AVAI_RESULT')
-                       ).replace('?plant', plant_id)
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'}, data={'task_id': task_id})
-        if response.status_code == 201:
-            response_json = response.json()
-            return response_json
-        elif response.status_code in [400, 404, 500, 202]:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def get_daily_metrics(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GET_DAILY_METRICS')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def generate_daily_metrics(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GENERATE_DAILY_METRICS')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def generate_daily_metrics_result(self, plant_id, task_id):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GENERATE_DAILY_METRICS_RESULT')
-                       ).replace('?plant', plant_id)
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'}, data={'task_id': task_id})
-        if response.status_code == 201:
-            response_json = response.json()
-            return response_json
-        elif response.status_code in [400, 404, 500, 202]:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def calculate_data(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('CALCULATE_DATA')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def calculate_data_result(self, plant_id, task_id):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('CALCULATE_DATA_RESULT')
-                       ).replace('?plant', plant_id)
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'}, data={'task_id': task_id})
-        if response.status_code in [200, 201]:
-            response_json = response.json()
-            return response_json
-        elif response.status_code in [400, 404, 500, 202]:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def recalculate_data(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('RECALCULATE_DATA')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def recalculate_data_result(self, plant_id, task_id):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('RECALCULATE_DATA_RESULT')
-                       ).replace('?plant', plant_id)
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'}, data={'task_id': task_id})
-        if response.status_code in [200, 201]:
-            response_json = response.json()
-            return response_json
-        elif response.status_code in [400, 404, 500, 202]:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def get_prmt_measurements(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('GET_PRMT_MEAS')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        else:
-            try:
-                logger.error(response.json())
-            except:
-                logger.error("Unknown error while getting prmt measurements")
-        return None
-
-    def post_prmt_measurements(self, plant_id, data):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('POST_PRMT_MEAS')).replace('?plant', plant_id)
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}',
-                                'content-type': 'application/json'}, data=data)
-        if response.status_code == 201:
-            response_json = response.json()
-            return response_json
-        elif response.status_code == 400:
-            logger.error(response.json())
-        return None
-
-    def update_prmt_measurement(self, plant_id, data):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('UPDATE_PRMT_MEAS')).replace('?plant', plant_id)
-        response = requests.put(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}',
-                                'content-type': 'application/json'}, data=data)
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def recalculate_monthly_data(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('RECALCULATE_MONTHLY_DATA')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def recalculate_monthly_data_result(self, plant_id, task_id):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('RECALCULATE_MONTHLY_DATA_RESULT')
-                       ).replace('?plant', plant_id)
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'}, data={'task_id': task_id})
-        if response.status_code in [200, 201]:
-            response_json = response.json()
-            return response_json
-        elif response.status_code in [400, 404, 500, 202]:
-            response_json = response.json()
-            return response_json
-        return None
-
 
 class APIAdminAgent(APIAgent):
-    def __init__(self):
-        super().__init__('API_ADMIN_')
-        return
-    
-    def create_profile(self, data):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('CREATE_PROFILE'))
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}',
-                                'content-type': 'application/json'}, data=data)
-        if response.status_code == 201:
-            response_json = response.json()
-            return response_json
-        elif response.status_code == 400:
-            logger.error(response.json())
-        return None
+    ROUTES = API_ROUTES + ADMIN_ROUTES
 
-    def profile_list(self):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('PROFILE_LIST'))
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def user_list(self):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('USER_LIST'))
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
+    def __init__(self, pool_size=None, keep_alive=None, upload_workers=None, compression=None,
+                 compression_level=None, metadata_cache=None, metrics=None):
+        super().__init__('API_ADMIN_', pool_size, keep_alive, upload_workers, compression, compression_level,
+                         metadata_cache, metrics)
 
     def update_profile(self, data):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('UPDATE_PROFILE')).replace('?profile', str(data['id']))
-        response = requests.put(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}',
-                                'content-type': 'application/json'}, data=data)
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        else:
-            logger.error(response.json())
-        return None
-    
-    def create_portfolio(self, data):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('CREATE_PORTFOLIO'))
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}',
-                                'content-type': 'application/json'}, data=data)
-        if response.status_code == 201:
-            response_json = response.json()
-            return response_json
-        return None
-
-    def portfolio_list(self):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('LIST_PORTFOLIO'))
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
+        return self.call('update_profile', str(data['id']), data)
 
     def update_portfolio(self, data):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('UPDATE_PORTFOLIO')).replace('?portfolio', str(data['id']))
-        response = requests.put(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}',
-                                'content-type': 'application/json'}, data=data)
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        return None
+        return self.call('update_portfolio', str(data['id']), data)
 
-    def create_plant(self, data):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('CREATE_PLANT'))
-        response = requests.post(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}',
-                                'content-type': 'application/json'}, data=data)
-        if response.status_code == 201:
-            response_json = response.json()
-            return response_json
-        else:
-            try:
-                logger.error(response.json())
-            except:
-                logger.error("Unknown error while creating plant")
-        return None
+    def update_plant(self, data):
+        return self.call('update_plant', str(json.loads(data)['plant_id']), data)
 
-    def list_plants(self, detailed=False):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('LIST_PLANT')).replace('?query_params', f'?detailed={detailed}')
-        response = requests.get(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        else:
-            try:
-                logger.error(response.json())
-            except:
-                logger.error("Unknown error while listing plants")
-        return None
 
-    def update_plant(self, data):
-        plant_id = json.loads(data)['plant_id']
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('UPDATE_PLANT')).replace('?plant', str(plant_id))
-        response = requests.put(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}',
-                                'content-type': 'application/json'}, data=data)
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        else:
-            try:
-                logger.error(response.json())
-            except:
-                logger.error("Unknown error while updating plant")
-        return None
+## El resto de los endpoints se genera desde la tabla de rutas (Routes.py)
 
-    def delete_gen_measurement(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('DELETE_GEN_MEAS')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.delete(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 204:
-            return {"message": "Gen measurements deleted successfully"}
-        else:
-            try:
-                logger.error(response.json())
-            except:
-                logger.error("Unknown error while deleting gen measurements")
-        return None
+def endpoint_method(route):
+    def method(self, *args, **kwargs):
+        return self.call(route.name, *args, **kwargs)
+    if route.cached:
+        return cached_metadata(route)(method)
+    return method
 
-    def delete_weather_measurement(self, plant_id, query_params):
-        PATH = urljoin(os.getenv('BASE_URL'), os.getenv('DELETE_WEATHER_MEAS')
-                       ).replace('?plant', plant_id).replace('?query_params', query_params)
-        response = requests.delete(PATH, headers={
-                                'Authorization': f'Bearer {self.access_token}'})
-        if response.status_code == 204:
-            return {"message": "Weather measurements deleted successfully"}
-        else:
-            try:
-                logger.error(response.json())
-            except:
-                logger.error("Unknown error while deleting weather measurements")
-        return None
+add_endpoint_methods(APIAgent, API_ROUTES, endpoint_method)
+add_endpoint_methods(APIAdminAgent, ADMIN_ROUTES, endpoint_method)
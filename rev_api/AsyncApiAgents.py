@@ -0,0 +1,378 @@
+import os, json, asyncio, time
+import aiohttp
+import logging
+from .Routes import API_ROUTES, ADMIN_ROUTES, add_endpoint_methods
+from .Metrics import METRICS, body_size
+from .ApiAgents import (AgentConfig, LoginFailedException, RefreshFailedException,
+                        TokenExpiredException, RETRY_STATUS, COMPRESSION_REJECTED_STATUS, Chunk,
+                        backoff_delay, chunk_body, compress_body, count_parts, prepare_chunks,
+                        summarize_chunks)
+from .ChunkBudgets import ChunkBudgets
+
+logger = logging.getLogger(__name__)
+
+## Version asyncio de APIAgent/APIAdminAgent, pensada para correr muchas
+## plantas/fechas desde un mismo event loop:
+##
+##     async with AsyncAPIAdminAgent() as agent:
+##         await agent.auth()
+##         results = await agent.generate_many([('generate_hper', '12', '?date=2024-01-01'), ...])
+
+class AsyncAPIAgent(AgentConfig):
+    def __init__(self, prefix='API_', pool_size=None, concurrency=None, compression=None,
+                 compression_level=None, metrics=None):
+        self.load_config(prefix)
+        self.chunk_budgets = ChunkBudgets()
+        self.init_routes()
+        self.metrics = metrics if metrics is not None else METRICS
+        self.init_compression(compression, compression_level)
+        if pool_size is None:
+            pool_size = int(os.getenv('POOL_SIZE', '10'))
+        if concurrency is None:
+            concurrency = int(os.getenv('ASYNC_CONCURRENCY', str(pool_size)))
+        self.pool_size = pool_size
+        self.concurrency = max(concurrency, 1)
+        self.max_retries = int(os.getenv('UPLOAD_RETRIES', '4'))
+        self.session = None
+        self.semaphore = None
+        return
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+        return
+
+    async def open(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size))
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        return
+
+    def auth_headers(self, content_json=False):
+        headers = {'Authorization': f'Bearer {self.access_token}'}
+        if content_json:
+            headers['content-type'] = 'application/json'
+        return headers
+
+    async def request(self, method, endpoint, PATH, headers=None, data=None):
+        ## todos los requests HTTP del agente salen por aca y quedan registrados en self.metrics;
+        ## devuelve (status, texto)
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, PATH, data=data, headers=headers) as response:
+                body = await response.read()
+                status, text = response.status, await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.metrics.record(endpoint, method, type(e).__name__, time.perf_counter() - start, body_size(data))
+            raise
+        self.metrics.record(endpoint, method, status, time.perf_counter() - start, body_size(data), len(body))
+        return status, text
+
+    async def send_json(self, method, label, endpoint, PATH, data):
+        ## igual que APIAgent.send_json; devuelve (status, texto, bytes enviados)
+        headers = self.auth_headers(content_json=True)
+        if not self.compress_for(endpoint):
+            status, text = await self.request(method, endpoint, PATH, headers, data)
+            return status, text, len(data)
+        raw, body = compress_body(data, self.compression_level)
+        status, text = await self.request(method, endpoint, PATH, {**headers, 'Content-Encoding': 'gzip'}, body)
+        if status not in COMPRESSION_REJECTED_STATUS:
+            return status, text, len(body)
+        fallback_status, fallback_text = await self.request(method, endpoint, PATH, headers, raw)
+        if fallback_status not in COMPRESSION_REJECTED_STATUS:
+            self.reject_compression(label, endpoint, status)
+        return fallback_status, fallback_text, len(raw)
+
+    async def call(self, name, *args, **kwargs):
+        ## ejecutor comun de los endpoints, igual que APIAgent.call
+        route = self.routes[name]
+        values, data = route.bind(args, kwargs)
+        PATH = self.url(name, **values)
+        await self.open()
+        async with self.semaphore:
+            if route.compress:
+                status, text, _ = await self.send_json(route.method, route.label, route.env, PATH, data)
+            else:
+                status, text = await self.request(route.method, route.env, PATH, self.route_headers(route), data)
+        if status in route.ok and route.message is not None:
+            return {'message': route.message}
+        if status in route.ok or status in route.passthrough:
+            return json.loads(text) if text else None
+        if route.error is not None:
+            try:
+                logger.error(json.loads(text))
+            except ValueError:
+                logger.error(f"Unknown error while {route.error}")
+        return None
+
+    async def login(self):
+        await self.open()
+        logger.debug('Logging in')
+        status, text = await self.request('POST', 'LOGIN', self.url('login'),
+                                          data={'username': self.username, 'password': self.password})
+        if status == 200:
+            logger.debug('Login successful')
+            response_json = json.loads(text)
+            self.access_token = response_json['access']
+            self.refresh_token = response_json['refresh']
+            self.save_config({
+                'username': self.username,
+                'access_token': self.access_token,
+                'refresh_token': self.refresh_token})
+        else:
+            logger.error(text)
+            raise LoginFailedException('Login failed')
+        return
+
+    async def refresh(self):
+        if self.token_state(self.refresh_token) == 'expired':
+            raise RefreshFailedException('Refresh token is expired')
+        await self.open()
+        logger.debug('Refreshing token')
+        status, text = await self.request('POST', 'REFRESH', self.url('refresh'),
+                                          data={'refresh': self.refresh_token})
+        if status == 200:
+            logger.debug('Token refresh successful')
+            response_json = json.loads(text)
+            self.access_token = response_json['access']
+            self.refresh_token = response_json['refresh']
+            self.save_config({'access_token': self.access_token,
+                              'refresh_token': self.refresh_token})
+        else:
+            raise RefreshFailedException('Token refresh failed')
+        return
+
+    async def validate(self):
+        await self.open()
+        logger.debug('Validating token')
+        status, _ = await self.request('GET', 'VALIDATE', self.url('validate'), headers=self.auth_headers())
+        if status == 200:
+            logger.debug('Token is valid')
+        else:
+            raise TokenExpiredException('Token is expired')
+        return
+
+    async def auth(self):
+        state = self.token_state()
+        if state == 'fresh':
+            logger.debug('Token is fresh, skipping validation')
+            return True
+        try:
+            if state == 'unknown':
+                await self.validate()
+            else:
+                raise TokenExpiredException(f'Token is {state}')
+        except TokenExpiredException:
+            try:
+                await self.refresh()
+            except RefreshFailedException:
+                try:
+                    await self.login()
+                except LoginFailedException:
+                    logger.error('Authentication failed')
+                    return False
+        logger.debug('Authentication successful')
+        return True
+
+    async def post_chunk(self, label, endpoint, PATH, chunk_data, result):
+        ## devuelve (status, texto de la respuesta, bytes enviados), reintentando 5xx y errores de conexion
+        attempt = 0
+        while True:
+            try:
+                status, text, sent = await self.send_json('POST', label, endpoint, PATH, chunk_data)
+                if status not in RETRY_STATUS or attempt >= self.max_retries:
+                    return status, text, sent
+                error = f"status code {status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                error = type(e).__name__
+            delay = backoff_delay(attempt)
+            attempt += 1
+            result['retries'] += 1
+            self.metrics.record_retry(endpoint)
+            logger.warning(f"{label}: Part {result['part']} failed with {error}, "
+                           f"retrying in {delay:.1f}s ({attempt}/{self.max_retries}).")
+            await asyncio.sleep(delay)
+
+    async def upload_chunk(self, label, endpoint, PATH, part, progress, chunk, stop_event,
+                           checkpoint=None):
+        result = {'part': part, 'start': chunk.start, 'rows': len(chunk), 'bytes': 0,
+                  'sent_bytes': 0, 'splits': 0, 'retries': 0}
+        async with self.semaphore:
+            if stop_event.is_set():
+                result['status'] = 'cancelled'
+                return result
+            start = time.perf_counter()
+            pending = [chunk]
+            while pending:
+                chunk = pending.pop(0)
+                chunk_data = chunk_body(chunk)
+                try:
+                    status, text, sent = await self.post_chunk(label, endpoint, PATH, chunk_data, result)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    stop_event.set()
+                    result['status'] = 'error'
+                    result['elapsed'] = round(time.perf_counter() - start, 3)
+                    logger.error(f"{label}: Failed to upload part {progress.part(part)}: {e}")
+                    return result
+                result['status_code'] = status
+                if status == 201:
+                    result['bytes'] += len(chunk_data)
+                    result['sent_bytes'] += sent
+                    result['max_bytes'] = max(result.get('max_bytes', 0), len(chunk_data))
+                    if checkpoint is not None:
+                        checkpoint.ack(chunk.start, chunk.start + len(chunk))
+                    continue
+                if status == 413 and len(chunk) > 1:
+                    half = len(chunk) // 2
+                    logger.warning(f"{label}: Part {part} too large ({len(chunk)} rows, "
+                                   f"{len(chunk_data)} bytes), splitting it in two.")
+                    pending[:0] = [Chunk(chunk.start, chunk[:half]), Chunk(chunk.start + half, chunk[half:])]
+                    result['splits'] += 1
+                    continue
+                stop_event.set()
+                result['status'] = 'error'
+                result['elapsed'] = round(time.perf_counter() - start, 3)
+                if status in [400, 413]:
+                    logger.error(text)
+                    if status == 413:
+                        logger.error(f"{label}: Payload too large, a single record exceeds the server limit.")
+                else:
+                    logger.error(f"{label}: Failed to upload part {progress.part(part)}. "
+                                 f"Status code: {status}")
+                return result
+        result['elapsed'] = round(time.perf_counter() - start, 3)
+        logger.info(f"{label}: Part {progress.part(part)} uploaded successfully "
+                    f"({progress.advance(result['rows'])}, {result['bytes']} bytes, {result['sent_bytes']} sent).")
+        result['status'] = 'success'
+        return result
+
+    async def upload_chunks(self, label, endpoint, PATH, data, chunk_size=None, chunk_bytes=None,
+                            checkpoint=None):
+        await self.open()
+        chunks, progress = prepare_chunks(data, chunk_size, self.chunk_budget(endpoint, chunk_bytes),
+                                          checkpoint)
+        stop_event = asyncio.Event()
+        results = []
+        pending = set()
+        generated = 0
+        ## los chunks se generan a medida que hay cupo, asi un iterable de registros se consume de a poco
+        for part, chunk in enumerate(chunks, start=1):
+            generated = part
+            if stop_event.is_set():
+                break
+            if len(pending) >= self.concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                results.extend(task.result() for task in done)
+                if stop_event.is_set():
+                    break
+            pending.add(asyncio.ensure_future(
+                self.upload_chunk(label, endpoint, PATH, part, progress, chunk, stop_event, checkpoint)))
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            results.extend(task.result() for task in done)
+        self.remember_chunk_budget(label, endpoint, results, chunk_bytes)
+        summary = summarize_chunks(label, results, count_parts(progress, generated, chunks), checkpoint)
+        if self.compression and summary['bytes']:
+            logger.info(f"{label}: {summary['bytes']} bytes sent as {summary['sent_bytes']} "
+                        f"({summary['bytes'] / max(summary['sent_bytes'], 1):.1f}x).")
+        return summary
+
+    async def wait_task(self, method_str, plant_id, query_params, interval=0.75,
+                        max_interval=10.0, max_missing=5):
+        response = await getattr(self, method_str)(plant_id, query_params)
+        job = {'operation': method_str, 'plant_id': plant_id, 'query': query_params}
+        if response is None:
+            logger.error(f"{method_str} {plant_id}: Task scheduling failed")
+            return {**job, 'status': 'error', 'message': 'Task scheduling failed'}
+        if 'task_id' not in response:
+            if 'message' in response:
+                logger.info(f"{method_str} {plant_id}: {response['message']}")
+                return {**job, 'status': 'success', 'message': response['message']}
+            logger.error(f"{method_str} {plant_id}: Task id not found")
+            return {**job, 'status': 'error', 'message': 'Task id not found'}
+        task_id = response['task_id']
+        job['task_id'] = task_id
+        logger.info(f"{method_str} {plant_id}: Task scheduled successfully")
+        result_method = getattr(self, method_str + '_result')
+        missing = 0
+        while True:
+            await asyncio.sleep(interval)
+            result = await result_method(plant_id, task_id)
+            if result is None:
+                missing += 1
+                if missing >= max_missing:
+                    logger.error(f"{method_str} {plant_id}: Task result not found")
+                    return {**job, 'status': 'error', 'message': 'Task result not found'}
+            elif result.get('status') != 'pending':
+                break
+            interval = min(interval * 1.5, max_interval)
+        if result.get('status') == 'success':
+            logger.info(f"{method_str} {plant_id}: Task completed successfully")
+        elif result.get('status') == 'error':
+            logger.error(f"{method_str} {plant_id}: Task failed")
+        else:
+            logger.error(f"{method_str} {plant_id}: Task status unknown")
+        return {**job, **result}
+
+    async def generate_many(self, submissions, interval=0.75):
+        ## submissions: lista de (method_str, plant_id, query_params), se esperan todas a la vez
+        return await asyncio.gather(*(
+            self.wait_task(method_str, plant_id, query_params, interval)
+            for method_str, plant_id, query_params in submissions))
+
+    async def post_gen_measurements(self, plant_id, data, chunk_size=None, chunk_bytes=None,
+                                    checkpoint=None):
+        PATH = self.url('post_gen_measurements', plant=plant_id)
+        return await self.upload_chunks('Gen', 'POST_GEN_MEAS', PATH, data, chunk_size, chunk_bytes, checkpoint)
+
+    async def post_weather_measurements(self, plant_id, data, chunk_size=None, chunk_bytes=None,
+                                        checkpoint=None):
+        PATH = self.url('post_weather_measurements', plant=plant_id)
+        return await self.upload_chunks('Weather', 'POST_WEATHER_MEAS', PATH, data, chunk_size, chunk_bytes, checkpoint)
+
+    async def post_incidents(self, plant_id, table, data, chunk_size=None, chunk_bytes=None,
+                             checkpoint=None):
+        PATH = self.url('post_incidents', plant=plant_id, table=table)
+        return await self.upload_chunks('Incidents', 'POST_INCIDENTS', PATH, data, chunk_size, chunk_bytes,
+                                        checkpoint)
+
+
+class AsyncAPIAdminAgent(AsyncAPIAgent):
+    ROUTES = API_ROUTES + ADMIN_ROUTES
+
+    def __init__(self, pool_size=None, concurrency=None, compression=None, compression_level=None,
+                 metrics=None):
+        super().__init__('API_ADMIN_', pool_size, concurrency, compression, compression_level, metrics)
+        return
+
+    async def update_profile(self, data):
+        return await self.call('update_profile', str(data['id']), data)
+
+    async def update_portfolio(self, data):
+        return await self.call('update_portfolio', str(data['id']), data)
+
+    async def update_plant(self, data):
+        return await self.call('update_plant', str(json.loads(data)['plant_id']), data)
+
+
+## El resto de los endpoints se genera desde la tabla de rutas (Routes.py)
+
+def async_endpoint_method(route):
+    async def method(self, *args, **kwargs):
+        return await self.call(route.name, *args, **kwargs)
+    return method
+
+add_endpoint_methods(AsyncAPIAgent, API_ROUTES, async_endpoint_method)
+add_endpoint_methods(AsyncAPIAdminAgent, ADMIN_ROUTES, async_endpoint_method)
@@ -0,0 +1,73 @@
+import os, json, threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+## Tamano de chunk aprendido por endpoint despues de un 413. Se guarda aparte de config.json
+## (que tiene las credenciales) y se escribe a un temporal que se renombra, asi varios threads
+## o procesos subiendo a la vez no dejan el archivo a medias. Cada subida completa sin 413
+## duplica el tamano hasta volver a CHUNK_BYTES, para que un limite temporal del servidor
+## no deje todas las corridas siguientes con chunks chicos.
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'chunk_budgets.json')
+
+
+def default_chunk_bytes():
+    return int(os.getenv('CHUNK_BYTES', str(256 * 1024)))
+
+def learned_chunk_bytes(results):
+    ## tamano del mayor pedazo que se subio despues de partir un chunk por un 413
+    sizes = [result['max_bytes'] for result in results if result.get('splits') and result.get('max_bytes')]
+    return max(sizes) if sizes else None
+
+
+class ChunkBudgets:
+    def __init__(self, path=None):
+        self.path = path or os.getenv('CHUNK_BUDGETS_PATH', BUDGETS_PATH)
+        self.lock = threading.Lock()
+        self.budgets = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                budgets = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return budgets if isinstance(budgets, dict) else {}
+
+    def save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.budgets, f)
+        os.replace(tmp_path, self.path)
+        return
+
+    def get(self, endpoint):
+        with self.lock:
+            return self.budgets.get(endpoint, default_chunk_bytes())
+
+    def learn(self, label, endpoint, results):
+        ## results son los de upload_chunk: con 413 se baja al mayor pedazo aceptado,
+        ## si todo subio sin partir se duplica hacia CHUNK_BYTES
+        default = default_chunk_bytes()
+        with self.lock:
+            current = self.budgets.get(endpoint)
+            chunk_bytes = learned_chunk_bytes(results)
+            if chunk_bytes is None:
+                if current is None or not results or any(result.get('status') != 'success' for result in results):
+                    return
+                chunk_bytes = current * 2
+            if chunk_bytes >= default:
+                if current is None:
+                    return
+                del self.budgets[endpoint]
+            elif chunk_bytes != current:
+                self.budgets[endpoint] = chunk_bytes
+            else:
+                return
+            self.save()
+        if chunk_bytes >= default:
+            logger.info(f"{label}: next uploads to {endpoint} will use the default {default} byte chunks.")
+        else:
+            logger.info(f"{label}: next uploads to {endpoint} will start with {chunk_bytes} byte chunks.")
+        return
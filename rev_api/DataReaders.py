@@ -0,0 +1,296 @@
+import os, re, csv, json
+import numpy as np
+
+## Lectura incremental de archivos de datos para las subidas: los registros se
+## producen de a uno mientras se lee el archivo, sin cargarlo completo en memoria.
+
+BLOCK_SIZE = 1 << 16
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NULL_VALUES = ['', 'null', 'None', 'nan', 'NaN']
+LEADING_ZERO = re.compile(r'[+-]?0\d')  ## '007', '-01': ids o codigos, no numeros
+COLUMNS_KEY = '__columns__'  ## orden de las columnas dentro de un .npz
+
+
+class RawRecords:
+    ## registros ya serializados como JSON, el agente los agrupa en chunks sin volver a parsearlos;
+    ## rows es la cantidad de registros si se pudo contar sin parsear el archivo (para el avance)
+    def __init__(self, items, rows=None):
+        self.items = items
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ['.ndjson', '.jsonl']:
+        return 'ndjson'
+    if extension == '.csv':
+        return 'csv'
+    if extension == '.npz':
+        return 'npz'
+    return 'json'
+
+def iter_records(path, data_format=None):
+    if data_format is None:
+        data_format = detect_format(path)
+    if data_format == 'ndjson':
+        return iter_ndjson(path)
+    if data_format == 'csv':
+        return iter_csv(path)
+    if data_format == 'json':
+        return iter_json_array(path)
+    if data_format == 'npz':
+        return iter_npz(path)
+    raise ValueError(f"Unknown data format: {data_format}")
+
+def count_rows(path, data_format):
+    ## cantidad de registros sin parsearlos; None para arreglos JSON, que habria que decodificar
+    if data_format == 'ndjson':
+        with open(path, 'r') as file:
+            return sum(1 for line in file if line.strip())
+    if data_format == 'csv':
+        with open(path, 'r', newline='') as file:
+            return max(sum(1 for row in csv.reader(file) if row) - 1, 0)
+    if data_format == 'npz':
+        with np.load(path, allow_pickle=False) as data:
+            names = data[COLUMNS_KEY].tolist() if COLUMNS_KEY in data.files else data.files
+            return len(data[names[0]]) if names else 0
+    return None
+
+def iter_raw_records(path, data_format=None):
+    if data_format is None:
+        data_format = detect_format(path)
+    if data_format == 'ndjson':
+        return RawRecords(iter_raw_ndjson(path), count_rows(path, data_format))
+    if data_format == 'csv':
+        return RawRecords((json.dumps(record) for record in iter_csv(path)), count_rows(path, data_format))
+    if data_format == 'json':
+        return RawRecords(iter_json_array(path, raw=True))
+    if data_format == 'npz':
+        return RawRecords((json.dumps(record) for record in iter_npz(path)), count_rows(path, data_format))
+    raise ValueError(f"Unknown data format: {data_format}")
+
+def iter_json_array(path, block_size=BLOCK_SIZE, raw=False):
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as file:
+        buffer = file.read(block_size)
+        eof = not buffer
+        pos = WHITESPACE.match(buffer, 0).end()
+        if buffer[pos:pos + 1] != '[':
+            ## no es un arreglo, se carga completo como antes
+            value = json.loads(buffer + file.read())
+            if not isinstance(value, list):
+                value = [value]
+            for record in value:
+                yield json.dumps(record) if raw else record
+            return
+        pos += 1
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                if eof:
+                    raise json.JSONDecodeError("Unterminated array", buffer, pos)
+                more = file.read(block_size)
+                eof = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            if buffer[pos] == ']':
+                return
+            if buffer[pos] == ',':
+                pos += 1
+                continue
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            ## un valor que termina justo al final del buffer puede estar cortado (ej. un numero)
+            if end is None or (end == len(buffer) and not eof):
+                more = file.read(max(block_size, len(buffer) - pos))
+                eof = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            if raw:
+                ## el texto original se reutiliza tal cual, salvo que venga indentado
+                item = buffer[pos:end]
+                yield json.dumps(record) if '\n' in item else item
+            else:
+                yield record
+            pos = end
+            if pos > block_size:
+                buffer = buffer[pos:]
+                pos = 0
+
+def iter_ndjson(path):
+    with open(path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def iter_raw_ndjson(path):
+    with open(path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield line
+
+def parse_csv_value(value):
+    ## los textos con ceros a la izquierda o '_' quedan como string, int('007') perderia el id
+    if value in NULL_VALUES:
+        return None
+    if LEADING_ZERO.match(value) or '_' in value:
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def iter_csv(path):
+    with open(path, 'r', newline='') as file:
+        for row in csv.DictReader(file):
+            yield {key: parse_csv_value(value) for key, value in row.items()}
+
+## Formato columnar comprimido: un arreglo numpy por columna en un .npz. Los faltantes de
+## columnas float se guardan como NaN; en las demas (enteros, strings, booleanos) se guarda
+## ademas una mascara de nulos, asi '007' sigue siendo '007' y un entero con None vuelve como
+## entero. Al leer, las columnas con mascara son np.ma.MaskedArray y los nulos vuelven como None.
+## Si a algun registro le falta la columna se guarda una mascara de ausentes y al leer esa clave
+## no aparece en el registro (en vez de volver como None). Las columnas con tipos mezclados
+## (ej. 7 y 'a') o con listas/dicts se guardan como texto JSON por valor, sin pickle, y vuelven
+## con sus tipos originales.
+
+NULLS_PREFIX = '__nulls__'  ## mascara de nulos de una columna dentro de un .npz
+ABSENT_PREFIX = '__absent__'  ## registros a los que les falta la columna
+JSON_PREFIX = '__json__'  ## marca de columna guardada como texto JSON
+
+def column_kind(values):
+    ## tipo comun de los valores no nulos: bool, int, float o str (cualquier otra mezcla)
+    present = [value for value in values if value is not None]
+    if not present:
+        return 'float'
+    if all(isinstance(value, bool) for value in present):
+        return 'bool'
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        return 'int'
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        return 'float'
+    return 'str'
+
+def mixed_column(values):
+    ## columna 'str' con algun valor que no es string: str() perderia el tipo
+    return column_kind(values) == 'str' and any(value is not None and not isinstance(value, str) for value in values)
+
+def null_mask(values):
+    return np.array([value is None for value in values], dtype=bool)
+
+def column_array(values):
+    ## arreglo de la columna con los nulos rellenados (NaN, 0, False o ''); ver null_mask
+    kind = column_kind(values)
+    if kind == 'int':
+        try:
+            return np.array([0 if value is None else value for value in values], dtype=np.int64)
+        except OverflowError:
+            kind = 'float'
+    if kind == 'float':
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    if kind == 'bool':
+        return np.array([False if value is None else value for value in values], dtype=bool)
+    return np.array(['' if value is None else str(value) for value in values], dtype=str)
+
+def column_values(array):
+    if isinstance(array, np.ma.MaskedArray):
+        nulls = np.ma.getmaskarray(array).tolist()
+        return [None if null else value for value, null in zip(array.data.tolist(), nulls)]
+    values = array.tolist()
+    if array.dtype.kind == 'f':
+        return [None if value != value else value for value in values]
+    return values
+
+def write_npz(path, records):
+    records = list(records)
+    names = []
+    for record in records:
+        for name in record:
+            if name not in names:
+                names.append(name)
+    columns = {}
+    for name in names:
+        values = [record.get(name) for record in records]
+        if mixed_column(values):
+            columns[name] = np.array(['' if value is None else json.dumps(value) for value in values], dtype=str)
+            columns[JSON_PREFIX + name] = np.array(True)
+        else:
+            columns[name] = column_array(values)
+        nulls = null_mask(values)
+        if columns[name].dtype.kind != 'f' and nulls.any():
+            columns[NULLS_PREFIX + name] = nulls
+        absent = np.array([name not in record for record in records], dtype=bool)
+        if absent.any():
+            columns[ABSENT_PREFIX + name] = absent
+    with open(path, 'wb') as file:
+        np.savez_compressed(file, **{COLUMNS_KEY: np.array(names, dtype=str)}, **columns)
+    return path
+
+def read_npz(path):
+    ## (columnas, mascaras de ausentes por columna)
+    with np.load(path, allow_pickle=False) as data:
+        names = data[COLUMNS_KEY].tolist() if COLUMNS_KEY in data.files else data.files
+        columns = {}
+        absent = {}
+        for name in names:
+            array = data[name]
+            if JSON_PREFIX + name in data.files:
+                ## arreglo de objetos en memoria (listas y dicts quedan como un solo valor);
+                ## en el archivo sigue siendo texto
+                texts = array.tolist()
+                array = np.empty(len(texts), dtype=object)
+                array[:] = [None if text == '' else json.loads(text) for text in texts]
+            if NULLS_PREFIX + name in data.files:
+                columns[name] = np.ma.MaskedArray(array, mask=data[NULLS_PREFIX + name])
+            else:
+                columns[name] = array
+            if ABSENT_PREFIX + name in data.files:
+                absent[name] = data[ABSENT_PREFIX + name].tolist()
+        return columns, absent
+
+def load_columns(path):
+    return read_npz(path)[0]
+
+def iter_npz(path):
+    columns, absent = read_npz(path)
+    names = list(columns)
+    rows = zip(*(column_values(columns[name]) for name in names))
+    if not absent:
+        for row in rows:
+            yield dict(zip(names, row))
+        return
+    masks = [absent.get(name) for name in names]
+    for index, row in enumerate(rows):
+        yield {name: value for name, value, mask in zip(names, row, masks) if mask is None or not mask[index]}
+
+def export_json(path, output_path=None, indent=None):
+    ## cualquier formato soportado -> arreglo JSON
+    if output_path is None:
+        output_path = os.path.splitext(path)[0] + '.json'
+    with open(output_path, 'w') as file:
+        json.dump(list(iter_records(path)), file, indent=indent)
+    return output_path
+
+def convert_file(path, output_path):
+    ## el formato de salida se deduce de la extension de output_path
+    data_format = detect_format(output_path)
+    if data_format == 'npz':
+        return write_npz(output_path, iter_records(path))
+    if data_format == 'json':
+        return export_json(path, output_path)
+    raise ValueError(f"Unsupported output format: {data_format}")
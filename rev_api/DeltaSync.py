@@ -0,0 +1,109 @@
+import os, json
+from datetime import datetime, timezone
+import numpy as np
+import logging
+from .DataReaders import column_array, null_mask
+
+logger = logging.getLogger(__name__)
+
+## Sincronizacion por diferencias: se bajan las filas que el servidor ya tiene para el rango
+## del archivo local, se comparan por timestamp y valor sobre arreglos numpy, y solo se
+## suben las filas nuevas (post_*) y las que cambiaron (update_*).
+
+SYNC_OPERATIONS = {
+    'gen': ('get_gen_measurements', 'post_gen_measurements', 'update_gen_measurement'),
+    'weather': ('get_weather_measurements', 'post_weather_measurements', 'update_weather_measurement'),
+}
+
+
+def parse_timestamp(timestamp):
+    ## ISO con o sin 'T', segundos u offset -> datetime UTC sin tzinfo; sin offset se toma como UTC
+    moment = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def normalize_timestamps(timestamps):
+    ## instantes UTC como datetime64[s]: '2024-01-01 00:00', '2024-01-01T00:00:00' y
+    ## '2024-01-01T03:00:00+03:00' son el mismo y se ordenan/buscan como fechas, no como texto
+    return np.array([parse_timestamp(timestamp) for timestamp in timestamps], dtype='datetime64[s]')
+
+def same_values(local, server):
+    ## comparacion columna a columna; NaN == NaN y floats con tolerancia
+    if local.dtype.kind in 'biuf' and server.dtype.kind in 'biuf':
+        return np.isclose(local.astype(np.float64), server.astype(np.float64), rtol=1e-9, atol=1e-9,
+                          equal_nan=True)
+    return local.astype(str) == server.astype(str)
+
+def diff_records(local_records, server_records, key='timestamp'):
+    ## devuelve (nuevas, cambiadas, sin cambios, cantidad solo en el servidor)
+    if not local_records:
+        return [], [], [], len(server_records)
+    if not server_records:
+        return list(local_records), [], [], 0
+    local_keys = normalize_timestamps([record[key] for record in local_records])
+    server_keys = normalize_timestamps([record[key] for record in server_records])
+    order = np.argsort(server_keys, kind='stable')
+    server_sorted = server_keys[order]
+    positions = np.searchsorted(server_sorted, local_keys)
+    positions = np.minimum(positions, len(server_sorted) - 1)
+    found = server_sorted[positions] == local_keys
+    matched_server = order[positions[found]]
+    matched_local = np.flatnonzero(found)
+
+    changed_mask = np.zeros(len(matched_local), dtype=bool)
+    columns = [name for name in local_records[0] if name != key]
+    for name in columns:
+        local_values = [local_records[index].get(name) for index in matched_local.tolist()]
+        server_values = [server_records[index].get(name) for index in matched_server.tolist()]
+        changed_mask |= ~same_values(column_array(local_values), column_array(server_values))
+        changed_mask |= null_mask(local_values) != null_mask(server_values)
+
+    new = [local_records[index] for index in np.flatnonzero(~found).tolist()]
+    changed = [local_records[index] for index in matched_local[changed_mask].tolist()]
+    unchanged = [local_records[index] for index in matched_local[~changed_mask].tolist()]
+    server_only = len(server_records) - len(np.unique(matched_server))
+    return new, changed, unchanged, server_only
+
+def record_range(records, key='timestamp'):
+    ## rango [primer dia, ultimo dia] (UTC) que cubre los registros locales; el end_date del
+    ## servidor es inclusivo
+    timestamps = normalize_timestamps([record[key] for record in records])
+    days = timestamps.astype('datetime64[D]')
+    return str(days.min()), str(days.max())
+
+def sync_measurements(agent, table, plant_id, records, window=None, update_chunk_size=None):
+    if table not in SYNC_OPERATIONS:
+        raise ValueError(f"Invalid table: {table}")
+    get_method, post_method, update_method = SYNC_OPERATIONS[table]
+    records = list(records)
+    report = {'status': 'success', 'table': table, 'rows': len(records), 'new': 0, 'changed': 0,
+              'unchanged': 0, 'server_only': 0, 'updated': 0}
+    if not records:
+        return report
+    start_date, end_date = record_range(records)
+    server_records = agent.get_measurements_range(get_method, plant_id, start_date, end_date,
+                                                  window=window)
+    if server_records is None:
+        logger.error(f"Sync {table}: could not fetch server rows for {start_date} - {end_date}")
+        report['status'] = 'error'
+        return report
+    new, changed, unchanged, server_only = diff_records(records, server_records)
+    report.update({'new': len(new), 'changed': len(changed), 'unchanged': len(unchanged),
+                   'server_only': server_only})
+    logger.info(f"Sync {table}: {len(new)} new, {len(changed)} changed, {len(unchanged)} unchanged, "
+                f"{server_only} only on server")
+    if new:
+        report['posted'] = getattr(agent, post_method)(plant_id, new)
+        if report['posted'] is None or report['posted'].get('status') == 'error':
+            report['status'] = 'error'
+    if update_chunk_size is None:
+        update_chunk_size = int(os.getenv('UPDATE_CHUNK_SIZE', '500'))
+    for start in range(0, len(changed), update_chunk_size):
+        part = changed[start:start + update_chunk_size]
+        if getattr(agent, update_method)(plant_id, json.dumps(part)) is None:
+            logger.error(f"Sync {table}: update failed for rows {start} - {start + len(part)}")
+            report['status'] = 'error'
+            break
+        report['updated'] += len(part)
+    return report
@@ -7,6 +7,9 @@ class JsonFileSelector:
         self.save_file_path = None
         self.fileypes = (
             ("json files", "*.json"),
+            ("ndjson files", "*.ndjson *.jsonl"),
+            ("csv files", "*.csv"),
+            ("npz files", "*.npz"),
             ("all files", "*.*")
         )
 
@@ -0,0 +1,137 @@
+import os, json, time, copy, threading, functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+## Cache de lectura para la metadata de plantas y portafolios (detalles, listas, accesos).
+## Cada endpoint tiene su TTL, las consultas iguales que llegan mientras otra esta en vuelo
+## esperan su resultado en vez de repetir la llamada, y opcionalmente se guarda en disco
+## para reutilizarla entre corridas del CLI.
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), 'metadata_cache.json')
+
+DEFAULT_TTLS = {
+    'plant_detail': 3600,
+    'portfolio_detail': 3600,
+    'get_portfolio_plants': 900,
+    'list_plants': 900,
+    'get_user_plants_access': 300,
+}
+
+## endpoints que quedan obsoletos despues de cada escritura de admin
+INVALIDATES = {
+    'update_plant': ['plant_detail', 'list_plants', 'get_portfolio_plants', 'get_user_plants_access'],
+    'create_plant': ['list_plants', 'get_portfolio_plants', 'get_user_plants_access'],
+    'update_portfolio': ['portfolio_detail', 'get_portfolio_plants'],
+    'create_portfolio': ['get_portfolio_plants'],
+}
+
+
+def endpoint_ttl(endpoint):
+    return float(os.getenv(f'METADATA_TTL_{endpoint.upper()}', str(DEFAULT_TTLS.get(endpoint, 300))))
+
+
+class MetadataCache:
+    def __init__(self, path=None, persist=None):
+        if persist is None:
+            persist = os.getenv('METADATA_CACHE_PERSIST', 'false').lower() in ['true', '1', 'yes']
+        self.path = path or os.getenv('METADATA_CACHE_PATH', CACHE_PATH)
+        self.persist = persist
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.entries = self.load() if persist else {}
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        now = time.time()
+        return {key: entry for key, entry in entries.items() if entry['expires'] > now}
+
+    def save(self):
+        if not self.persist:
+            return
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        return
+
+    def get_or_fetch(self, endpoint, key, fetch):
+        ## devuelve una copia, asi quien la modifique no altera lo guardado
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['expires'] > time.time():
+                self.hits += 1
+                return copy.deepcopy(entry['value'])
+            waiting = self.in_flight.get(key)
+            if waiting is None:
+                waiting = self.in_flight[key] = {'event': threading.Event(), 'value': None}
+                owner = True
+                self.misses += 1
+            else:
+                owner = False
+                self.coalesced += 1
+        if not owner:
+            waiting['event'].wait()
+            return copy.deepcopy(waiting['value'])
+        value = None
+        try:
+            value = fetch()
+        finally:
+            with self.lock:
+                ## las respuestas fallidas (None) no se guardan
+                if value is not None:
+                    self.entries[key] = {'endpoint': endpoint, 'value': value,
+                                         'expires': time.time() + endpoint_ttl(endpoint)}
+                    self.save()
+                waiting['value'] = value
+                del self.in_flight[key]
+            waiting['event'].set()
+        return copy.deepcopy(value)
+
+    def invalidate(self, *endpoints):
+        with self.lock:
+            stale = [key for key, entry in self.entries.items() if entry['endpoint'] in endpoints]
+            for key in stale:
+                del self.entries[key]
+            if stale:
+                self.save()
+        logger.debug(f"Invalidated {len(stale)} cached entries for {', '.join(endpoints)}")
+        return
+
+    def invalidate_after(self, operation):
+        return self.invalidate(*INVALIDATES.get(operation, []))
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.save()
+        return
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced,
+                    'entries': len(self.entries)}
+
+
+def cached_metadata(route):
+    ## decorador para los metodos del agente; sin metadata_cache se llama directo. La clave sale
+    ## de route.bind (ids como str, defaults aplicados), asi plant_detail(1), plant_detail('1') y
+    ## plant_detail(plant_id=1) comparten la entrada
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, 'metadata_cache', None)
+            if cache is None:
+                return method(self, *args, **kwargs)
+            values, data = route.bind(args, kwargs)
+            key = json.dumps([self.username, route.name, sorted(values.items()), data], default=str)
+            return cache.get_or_fetch(route.name, key, lambda: method(self, *args, **kwargs))
+        return wrapper
+    return decorator
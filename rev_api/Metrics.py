@@ -0,0 +1,158 @@
+import os, json, time, threading
+from collections import Counter
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+## Metricas por endpoint de los requests a la API: cantidad, status codes, latencias
+## (p50/p95/p99 e histograma), bytes enviados y recibidos y reintentos. Todos los agentes
+## del proceso registran en el mismo RequestMetrics (METRICS), asi un pipeline con varias
+## sesiones deja un solo resumen. Al final de la corrida se exporta como JSON y, si se pide,
+## como textfile de Prometheus para el node exporter.
+##
+##     export_metrics('metrics.json', '/var/lib/node_exporter/revapi.prom')
+
+## limites (segundos) de los buckets del histograma de Prometheus
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def body_size(data):
+    ## bytes del body tal como lo manda requests/aiohttp (dict = form urlencoded)
+    if data is None:
+        return 0
+    if isinstance(data, bytes):
+        return len(data)
+    if isinstance(data, str):
+        return len(data.encode())
+    if isinstance(data, dict):
+        return len('&'.join(f'{key}={value}' for key, value in data.items()))
+    return 0
+
+def percentiles(latencies):
+    if not latencies:
+        return {'p50': None, 'p95': None, 'p99': None}
+    p50, p95, p99 = np.percentile(np.array(latencies), [50, 95, 99])
+    return {'p50': round(float(p50), 4), 'p95': round(float(p95), 4), 'p99': round(float(p99), 4)}
+
+def bucket_counts(latencies, buckets=LATENCY_BUCKETS):
+    ## cantidad acumulada de requests con latencia <= cada limite
+    latencies = np.sort(np.array(latencies, dtype=np.float64))
+    counts = np.searchsorted(latencies, np.array(buckets), side='right')
+    return [int(count) for count in counts]
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.started = time.time()
+
+    def endpoint(self, name, method):
+        entry = self.endpoints.get(name)
+        if entry is None:
+            entry = self.endpoints[name] = {'method': method, 'requests': 0, 'status': Counter(),
+                                            'latencies': [], 'request_bytes': 0, 'response_bytes': 0,
+                                            'retries': 0}
+        return entry
+
+    def record(self, name, method, status, elapsed, request_bytes=0, response_bytes=0):
+        ## status es el status code, o el nombre de la excepcion si el request no tuvo respuesta
+        with self.lock:
+            entry = self.endpoint(name, method)
+            entry['requests'] += 1
+            entry['status'][str(status)] += 1
+            entry['latencies'].append(elapsed)
+            entry['request_bytes'] += request_bytes
+            entry['response_bytes'] += response_bytes
+        return
+
+    def record_retry(self, name, method='POST'):
+        with self.lock:
+            self.endpoint(name, method)['retries'] += 1
+        return
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+            self.started = time.time()
+        return
+
+    def snapshot(self):
+        with self.lock:
+            return {name: {**entry, 'status': dict(entry['status']), 'latencies': list(entry['latencies'])}
+                    for name, entry in self.endpoints.items()}
+
+    def summary(self):
+        endpoints = self.snapshot()
+        summary = {'started': self.started, 'elapsed': round(time.time() - self.started, 3), 'endpoints': {}}
+        for name in sorted(endpoints):
+            entry = endpoints[name]
+            latencies = entry.pop('latencies')
+            entry['latency'] = {'total': round(sum(latencies), 4), **percentiles(latencies)}
+            summary['endpoints'][name] = entry
+        return summary
+
+    def save_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=4)
+        return filename
+
+    def prometheus_text(self, prefix='revapi'):
+        endpoints = self.snapshot()
+        lines = [f'# HELP {prefix}_requests_total Requests sent to the REV API.',
+                 f'# TYPE {prefix}_requests_total counter']
+        for name in sorted(endpoints):
+            for status, count in sorted(endpoints[name]['status'].items()):
+                lines.append(f'{prefix}_requests_total{{endpoint="{name}",status="{status}"}} {count}')
+        lines += [f'# HELP {prefix}_request_duration_seconds Request latency.',
+                  f'# TYPE {prefix}_request_duration_seconds histogram']
+        for name in sorted(endpoints):
+            latencies = endpoints[name]['latencies']
+            for bucket, count in zip(LATENCY_BUCKETS, bucket_counts(latencies)):
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{endpoint="{name}",le="{bucket}"}} {count}')
+            lines.append(f'{prefix}_request_duration_seconds_bucket{{endpoint="{name}",le="+Inf"}} {len(latencies)}')
+            lines.append(f'{prefix}_request_duration_seconds_sum{{endpoint="{name}"}} {sum(latencies):.6f}')
+            lines.append(f'{prefix}_request_duration_seconds_count{{endpoint="{name}"}} {len(latencies)}')
+        for metric, key, help_text in [('request_bytes_total', 'request_bytes', 'Request body bytes sent.'),
+                                       ('response_bytes_total', 'response_bytes', 'Response body bytes received.'),
+                                       ('retries_total', 'retries', 'Requests retried after a 5xx or connection error.')]:
+            lines += [f'# HELP {prefix}_{metric} {help_text}', f'# TYPE {prefix}_{metric} counter']
+            for name in sorted(endpoints):
+                lines.append(f'{prefix}_{metric}{{endpoint="{name}"}} {endpoints[name][key]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, filename):
+        ## el textfile collector puede leer en cualquier momento, se escribe a un temporal y se renombra
+        tmp_path = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, filename)
+        return filename
+
+    def log_summary(self, log=None):
+        log = log or logger
+        for name, entry in self.summary()['endpoints'].items():
+            latency = entry['latency']
+            log.info(f"{name}: {entry['requests']} requests {entry['status']}, p50 {latency['p50']}s, "
+                     f"p95 {latency['p95']}s, p99 {latency['p99']}s, {entry['request_bytes']} bytes sent, "
+                     f"{entry['response_bytes']} received, {entry['retries']} retries")
+        return
+
+
+METRICS = RequestMetrics()
+
+
+def export_metrics(json_path=None, prometheus_path=None, metrics=None):
+    ## sin paths se usan METRICS_PATH / METRICS_PROM_PATH; si no hay ninguno no se escribe nada
+    if metrics is None:
+        metrics = METRICS
+    json_path = json_path or os.getenv('METRICS_PATH')
+    prometheus_path = prometheus_path or os.getenv('METRICS_PROM_PATH')
+    if json_path:
+        metrics.save_json(json_path)
+        logger.info(f"Request metrics written to {json_path}")
+    if prometheus_path:
+        metrics.write_prometheus(prometheus_path)
+        logger.info(f"Prometheus metrics written to {prometheus_path}")
+    return
@@ -1,12 +1,18 @@
 import json
 import getpass, re, os
-from time import sleep
+from urllib.parse import parse_qsl
 from .ApiAgents import APIAdminAgent, APIAgent
 from .FileSelector import JsonFileSelector
+from .DataReaders import detect_format, iter_npz
+from .UploadSession import UploadSession, UPLOAD_OPERATIONS, upload_failed
+from .TaskScheduler import TaskScheduler
 import unicodedata
 from utils.utils import setup_logger
 
 
+RANGE_OPERATIONS = ["get_gen_measurements", "get_weather_measurements", "get_prmt_measurements"]
+
+
 def is_valid_email(email):
     return re.match(r"[^@]+@[^@]+\.[^@]+", email)
 
@@ -21,11 +27,12 @@ def is_float(value):
 
 class MiddlewareAgent:
     def __init__(self, agent, logger_level, data_path=None, query=None,
-                 id=None, table=None):
+                 id=None, table=None, workers=None, compression=None, window=None, output_path=None,
+                 resume=None):
         if agent == "admin":
-            self.agent = APIAdminAgent()
+            self.agent = APIAdminAgent(upload_workers=workers, compression=compression)
         elif agent == "user":
-            self.agent = APIAgent()
+            self.agent = APIAgent(upload_workers=workers, compression=compression)
         else:
             raise ValueError("Invalid agent")
         self.logger = setup_logger(logger_level)
@@ -35,10 +42,13 @@ class MiddlewareAgent:
         self.query = query
         self.id = id
         self.table = table
+        self.window = window
+        self.output_path = output_path
+        self.upload_session = UploadSession(agent=self.agent, resume=resume)
         return
     
     def auth(self):
-        return self.agent.auth()
+        return self.upload_session.auth()
 
     def input_profile(self):
         username = input("Enter username: ").strip()
@@ -356,14 +366,17 @@ class MiddlewareAgent:
         if not os.path.exists(self.data_path):
             self.logger.error("Data file not found")
             return None
+        if detect_format(self.data_path) == "npz":
+            return json.dumps(list(iter_npz(self.data_path)))
         with open(self.data_path, "r") as file:
-            try:
-                data = json.load(file)
-            except json.JSONDecodeError as e:
-                self.logger.error("Invalid JSON file")
-                self.logger.debug(e.msg)
-                return None
-        return json.dumps(data)
+            data = file.read()
+        try:
+            json.loads(data)
+        except json.JSONDecodeError as e:
+            self.logger.error("Invalid JSON file")
+            self.logger.debug(e.msg)
+            return None
+        return data
 
     def select_data_path(self):
         data_path = self.file_selector.open_file()
@@ -388,12 +401,15 @@ class MiddlewareAgent:
                 id_str = input(f"Enter " + msg).strip()
         if self.data_path is None:
             self.select_data_path()
-        data = self.load_data()
-        if data is None:
-            self.logger.error(f"Data load failed for {method_str}")
-            return
-        response = getattr(self.agent, method_str)(id_str, data)
-        if response is not None:
+        if method_str in UPLOAD_OPERATIONS:
+            response = self.upload_session.upload(method_str, id_str, self.data_path)
+        else:
+            data = self.load_data()
+            if data is None:
+                self.logger.error(f"Data load failed for {method_str}")
+                return
+            response = getattr(self.agent, method_str)(id_str, data)
+        if not upload_failed(response):
             self.logger.info(f'Successful operation {method_str.upper()}')
             self.logger.debug(json.dumps(response, indent=4))
         else:
@@ -423,10 +439,20 @@ class MiddlewareAgent:
             query = self.query
         else:
             query = self.enter_query_params(query_params)
-        response = getattr(self.agent, method_str)(id_str, query)
+        params = dict(parse_qsl(query.lstrip('?')))
+        if (method_str in RANGE_OPERATIONS and 'start_date' in params and 'end_date' in params
+                and (self.window is not None or self.output_path is not None)):
+            response = self.agent.get_measurements_range(method_str, id_str, params['start_date'],
+                                                         params['end_date'], query, self.window,
+                                                         output_path=self.output_path)
+        else:
+            response = getattr(self.agent, method_str)(id_str, query)
         if response is not None:
             self.logger.info(f'Successful operation {method_str.upper()}')
-            self.logger.debug(json.dumps(response, indent=4))
+            if self.output_path is not None and method_str in RANGE_OPERATIONS:
+                self.logger.info(f"Data saved to {response}")
+            else:
+                self.logger.debug(json.dumps(response, indent=4))
         else:
             self.logger.error("Operation failed")
         return
@@ -441,10 +467,6 @@ class MiddlewareAgent:
                 plant_id = input(f"Enter plant id: ")
         if self.data_path is None:
             self.select_data_path()
-        data = self.load_data()
-        if data is None:
-            self.logger.error("Data load failed")
-            return
         if self.table is not None:
             table = self.table
         else:
@@ -452,8 +474,8 @@ class MiddlewareAgent:
             while table not in ["gen", "weather"]:
                 print("Invalid table")
                 table = input("Enter table: ")
-        response = self.agent.post_incidents(plant_id, table, data)
-        if response is not None:
+        response = self.upload_session.upload_incidents(plant_id, table, self.data_path)
+        if not upload_failed(response):
             self.logger.info("Incident posted successfully")
             self.logger.debug(json.dumps(response, indent=4))
         else:
@@ -461,50 +483,21 @@ class MiddlewareAgent:
         return
 
     def generate_methods(self, method_str, query_params):
+        ## acepta varias plantas separadas por coma; las tareas se consultan todas a la vez
         if self.id is not None:
-            plant_id = self.id
+            plant_ids = self.id
         else:
-            plant_id = input("Enter plant id: ")
-            while not plant_id or not plant_id.isdigit():
+            plant_ids = input("Enter plant id: ")
+            while not plant_ids or not all(plant_id.strip().isdigit() for plant_id in plant_ids.split(",")):
                 print("Invalid plant id")
-                plant_id = input("Enter plant id: ")
+                plant_ids = input("Enter plant id: ")
         if self.query is not None:
             query = self.query
         else:
             query = self.enter_query_params(query_params)
-        reulst_method_str = method_str + "_result"
-        response = getattr(self.agent, method_str)(plant_id, query)
-        if response is not None:
-            try:
-                task_id = response["task_id"]
-            except KeyError:
-                try:
-                    message = response["message"]
-                    self.logger.info(message)
-                except KeyError:
-                    self.logger.error("Task id not found")
-                return
-            self.logger.info(f"Task scheduled successfully")
-            self.logger.debug(json.dumps(response, indent=4))
-            result = getattr(self.agent, reulst_method_str)(plant_id, task_id)
-            if result is not None:
-                status = result["status"]
-                while status == "pending":
-                    self.logger.info("Task is pending")
-                    result = getattr(self.agent, reulst_method_str)(plant_id, task_id)
-                    status = result["status"]
-                    sleep(0.75)
-                if status == "success":
-                    self.logger.info("Task completed successfully")
-                    self.logger.debug(json.dumps(result, indent=4))
-                elif status == "error":
-                    self.logger.error("Task failed")
-                    self.logger.debug(json.dumps(result, indent=4))
-                else:
-                    self.logger.error("Task status unknown")
-                    self.logger.debug(json.dumps(result, indent=4))
-            else:
-                self.logger.error("Task result not found")
-        else:
-            self.logger.error("Task scheduling failed")
+        submissions = [(method_str, plant_id.strip(), query) for plant_id in plant_ids.split(",")]
+        scheduler = TaskScheduler(self.agent)
+        for result in scheduler.as_completed(submissions):
+            self.logger.debug(json.dumps(result, indent=4))
+        self.logger.info(f"{len(submissions)} tasks resolved with {scheduler.polls} result polls")
         return
\ No newline at end of file
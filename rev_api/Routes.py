@@ -0,0 +1,172 @@
+import os, re, inspect
+from urllib.parse import urljoin
+
+## Tabla declarativa de los endpoints de la API. Cada ruta dice de que variable de entorno
+## sale su URL, con que metodo HTTP se llama, que argumentos recibe y con que status codes
+## se devuelve el JSON de la respuesta. Los agentes compilan las URLs una vez al construirse
+## y los metodos de endpoint (plant_detail, generate_hper, ...) se generan desde la tabla,
+## todos sobre el mismo ejecutor de requests (APIAgent.call / AsyncAPIAgent.call).
+
+## argumento del metodo -> placeholder de la URL ('/plants/?plant/hper/?query_params')
+PLACEHOLDERS = {
+    'plant_id': 'plant',
+    'portfolio_id': 'portfolio',
+    'profile_id': 'profile',
+    'table': 'table',
+    'query_params': 'query_params',
+}
+PLACEHOLDER_PATTERN = re.compile(r'\?(plant|portfolio|profile|table|query_params)')
+
+## los *_result devuelven el JSON tambien cuando la tarea sigue pendiente o fallo
+TASK_RESULT_STATUS = (400, 404, 500, 202)
+
+
+class Route:
+    def __init__(self, name, env, method='GET', args=(), ok=(200,), passthrough=(), json_body=False,
+                 compress=False, auth=True, error=None, message=None, cached=False, label=None):
+        self.name = name
+        self.env = env
+        self.method = method
+        self.args = args
+        self.ok = ok
+        self.passthrough = passthrough
+        self.json_body = json_body
+        self.compress = compress
+        self.auth = auth
+        self.error = error
+        self.message = message
+        self.cached = cached
+        self.label = label or name
+        self.fields = {PLACEHOLDERS[arg] for arg in args if arg in PLACEHOLDERS}
+        if 'detailed' in args:
+            self.fields.add('query_params')
+        self.signature = inspect.Signature(
+            [inspect.Parameter('self', inspect.Parameter.POSITIONAL_OR_KEYWORD)] +
+            [inspect.Parameter(arg, inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                               default=False if arg == 'detailed' else inspect.Parameter.empty)
+             for arg in args])
+
+    def compile(self, base_url=None):
+        ## '/plants/?plant/hper/?query_params' -> 'https://.../plants/{plant}/hper/{query_params}'
+        path = os.getenv(self.env)
+        if path is None:
+            return None
+        url = urljoin(base_url or '', path).replace('{', '{{').replace('}', '}}')
+        return PLACEHOLDER_PATTERN.sub(
+            lambda match: '{' + match.group(1) + '}' if match.group(1) in self.fields else match.group(0), url)
+
+    def bind(self, args, kwargs):
+        ## (valores de la URL, body) a partir de los argumentos del metodo; se arma a mano
+        ## porque inspect.Signature.bind cuesta mas que el resto del armado de la URL
+        if len(args) > len(self.args):
+            raise TypeError(f"{self.name}() takes {len(self.args)} arguments, {len(args)} given")
+        arguments = dict(zip(self.args, args))
+        for arg, value in kwargs.items():
+            if arg not in self.args or arg in arguments:
+                raise TypeError(f"{self.name}() got an unexpected or repeated argument '{arg}'")
+            arguments[arg] = value
+        if 'detailed' in self.args:
+            arguments.setdefault('detailed', False)
+        if len(arguments) < len(self.args):
+            missing = [arg for arg in self.args if arg not in arguments]
+            raise TypeError(f"{self.name}() missing arguments: {', '.join(missing)}")
+        values = {}
+        data = None
+        for arg, value in arguments.items():
+            if arg in PLACEHOLDERS:
+                values[PLACEHOLDERS[arg]] = str(value)
+            elif arg == 'detailed':
+                values['query_params'] = f'?detailed={value}'
+            elif arg == 'task_id':
+                data = {'task_id': value}
+            elif arg == 'data':
+                data = value
+        return values, data
+
+
+def task_routes(name, env, **options):
+    ## tarea del servidor (GET que devuelve task_id) y su *_result
+    return [
+        Route(name, env, args=('plant_id', 'query_params'), **options),
+        Route(name + '_result', env + '_RESULT', 'POST', args=('plant_id', 'task_id'), ok=(200, 201),
+              passthrough=TASK_RESULT_STATUS),
+    ]
+
+
+API_ROUTES = [
+    Route('login', 'LOGIN', 'POST', auth=False),
+    Route('refresh', 'REFRESH', 'POST', auth=False),
+    Route('validate', 'VALIDATE'),
+    Route('plant_detail', 'PLANT_DETAIL', args=('plant_id',), cached=True),
+    Route('portfolio_detail', 'PORTFOLIO_DETAIL', args=('portfolio_id',), cached=True),
+    Route('get_user_plants_access', 'GET_USER_PLANTS_ACCESS', cached=True),
+    Route('get_user_portfolios_access', 'GET_USER_PORTFOLIOS_ACCESS', args=('detailed',)),
+    Route('get_portfolio_plants', 'GET_PORTFOLIO_PLANTS', args=('portfolio_id', 'detailed'), cached=True),
+    Route('get_gen_measurements', 'GET_GEN_MEAS', args=('plant_id', 'query_params'),
+          error='getting gen measurements'),
+    Route('get_weather_measurements', 'GET_WEATHER_MEAS', args=('plant_id', 'query_params'),
+          error='getting weather measurements'),
+    Route('post_gen_measurements', 'POST_GEN_MEAS', 'POST', args=('plant_id', 'data'), ok=(201,),
+          json_body=True, compress=True, label='Gen'),
+    Route('post_weather_measurements', 'POST_WEATHER_MEAS', 'POST', args=('plant_id', 'data'), ok=(201,),
+          json_body=True, compress=True, label='Weather'),
+    Route('update_gen_measurement', 'UPDATE_GEN_MEAS', 'POST', args=('plant_id', 'data'),
+          json_body=True, compress=True, label='Gen update'),
+    Route('update_weather_measurement', 'UPDATE_WEATHER_MEAS', 'POST', args=('plant_id', 'data'),
+          json_body=True, compress=True, label='Weather update'),
+    Route('get_incidents', 'GET_INCIDENTS', args=('plant_id', 'query_params')),
+    Route('post_incidents', 'POST_INCIDENTS', 'POST', args=('plant_id', 'table', 'data'), ok=(201,),
+          json_body=True, compress=True, label='Incidents'),
+    Route('get_hper', 'GET_HPER', args=('plant_id', 'query_params')),
+    *task_routes('generate_hper', 'GENERATE_HPER'),
+    Route('get_daily_availability', 'GET_DAILY_AVAI', args=('plant_id', 'query_params')),
+    *task_routes('generate_daily_availability', 'GENERATE_DAILY_AVAI'),
+    Route('get_daily_metrics', 'GET_DAILY_METRICS', args=('plant_id', 'query_params')),
+    *task_routes('generate_daily_metrics', 'GENERATE_DAILY_METRICS'),
+    *task_routes('calculate_data', 'CALCULATE_DATA'),
+    *task_routes('recalculate_data', 'RECALCULATE_DATA'),
+    Route('get_prmt_measurements', 'GET_PRMT_MEAS', args=('plant_id', 'query_params'),
+          error='getting prmt measurements'),
+    Route('post_prmt_measurements', 'POST_PRMT_MEAS', 'POST', args=('plant_id', 'data'), ok=(201,),
+          json_body=True, compress=True, error='posting prmt measurements', label='PRMT'),
+    Route('update_prmt_measurement', 'UPDATE_PRMT_MEAS', 'PUT', args=('plant_id', 'data'),
+          json_body=True, compress=True, label='PRMT update'),
+    *task_routes('recalculate_monthly_data', 'RECALCULATE_MONTHLY_DATA'),
+]
+
+ADMIN_ROUTES = [
+    Route('create_profile', 'CREATE_PROFILE', 'POST', args=('data',), ok=(201,), json_body=True,
+          error='creating profile'),
+    Route('profile_list', 'PROFILE_LIST'),
+    Route('user_list', 'USER_LIST'),
+    Route('update_profile', 'UPDATE_PROFILE', 'PUT', args=('profile_id', 'data'), json_body=True,
+          error='updating profile'),
+    Route('create_portfolio', 'CREATE_PORTFOLIO', 'POST', args=('data',), ok=(201,), json_body=True),
+    Route('portfolio_list', 'LIST_PORTFOLIO'),
+    Route('update_portfolio', 'UPDATE_PORTFOLIO', 'PUT', args=('portfolio_id', 'data'), json_body=True),
+    Route('create_plant', 'CREATE_PLANT', 'POST', args=('data',), ok=(201,), json_body=True,
+          error='creating plant'),
+    Route('list_plants', 'LIST_PLANT', args=('detailed',), cached=True, error='listing plants'),
+    Route('update_plant', 'UPDATE_PLANT', 'PUT', args=('plant_id', 'data'), json_body=True,
+          error='updating plant'),
+    Route('delete_gen_measurement', 'DELETE_GEN_MEAS', 'DELETE', args=('plant_id', 'query_params'),
+          ok=(204,), message='Gen measurements deleted successfully', error='deleting gen measurements'),
+    Route('delete_weather_measurement', 'DELETE_WEATHER_MEAS', 'DELETE', args=('plant_id', 'query_params'),
+          ok=(204,), message='Weather measurements deleted successfully',
+          error='deleting weather measurements'),
+]
+
+
+def add_endpoint_methods(cls, routes, factory):
+    ## genera un metodo por ruta con factory(route); los que la clase ya define a mano
+    ## (login, subidas por chunks, updates que sacan el id del body) se respetan
+    for route in routes:
+        if route.name in cls.__dict__:
+            continue
+        method = factory(route)
+        method.__name__ = route.name
+        method.__qualname__ = f"{cls.__name__}.{route.name}"
+        method.__signature__ = route.signature
+        method.__doc__ = f"{route.method} {route.env}"
+        setattr(cls, route.name, method)
+    return
@@ -0,0 +1,142 @@
+import os, time, heapq, random, itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+## Programa tareas del servidor (generate_hper, generate_daily_availability, ...) y consulta
+## todos los *_result pendientes desde un solo loop: cada tarea espera un intervalo que crece
+## mientras siga pendiente (con jitter, para no consultar todas juntas) y un tope global de
+## consultas por segundo protege al servidor cuando hay muchas tareas en vuelo.
+##
+##     scheduler = TaskScheduler(agent)
+##     for result in scheduler.as_completed([('generate_hper', '12', '?date=2024-01-01'), ...]):
+##         print(result['plant_id'], result['status'])
+
+
+class TaskScheduler:
+    def __init__(self, agent, interval=None, max_interval=None, max_rate=None, max_missing=5,
+                 timeout=None, backoff=1.5, max_in_flight=None):
+        if interval is None:
+            interval = float(os.getenv('TASK_POLL_INTERVAL', '0.75'))
+        if max_interval is None:
+            max_interval = float(os.getenv('TASK_POLL_MAX_INTERVAL', '10'))
+        if max_rate is None:
+            max_rate = float(os.getenv('TASK_POLL_RATE', '5'))
+        if timeout is None and os.getenv('TASK_TIMEOUT'):
+            timeout = float(os.getenv('TASK_TIMEOUT'))
+        if max_in_flight is None and os.getenv('TASK_MAX_IN_FLIGHT'):
+            max_in_flight = int(os.getenv('TASK_MAX_IN_FLIGHT'))
+        self.agent = agent
+        self.interval = interval
+        self.max_interval = max(max_interval, interval)
+        self.min_gap = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.max_missing = max_missing
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_in_flight = max(max_in_flight, 1) if max_in_flight else None
+        self.pending = []
+        self.counter = itertools.count()
+        self.last_poll = 0.0
+        self.polls = 0
+
+    def jittered(self, interval):
+        return interval * random.uniform(0.75, 1.25)
+
+    def submit(self, method_str, plant_id, query_params):
+        ## programa la tarea; devuelve el resultado final si no hay nada que esperar, o None
+        job = {'operation': method_str, 'plant_id': plant_id, 'query': query_params,
+               'submitted': time.monotonic(), 'polls': 0, 'missing': 0}
+        response = getattr(self.agent, method_str)(plant_id, query_params)
+        if response is None:
+            logger.error(f"{method_str} {plant_id}: Task scheduling failed")
+            return self.finish(job, {'status': 'error', 'message': 'Task scheduling failed'})
+        if 'task_id' not in response:
+            if 'message' in response:
+                logger.info(f"{method_str} {plant_id}: {response['message']}")
+                return self.finish(job, {'status': 'success', 'message': response['message']})
+            logger.error(f"{method_str} {plant_id}: Task id not found")
+            return self.finish(job, {'status': 'error', 'message': 'Task id not found'})
+        job['task_id'] = response['task_id']
+        job['interval'] = self.interval
+        logger.info(f"{method_str} {plant_id}: Task scheduled successfully")
+        ## la primera consulta tambien espera, la tarea recien programada casi nunca esta lista
+        self.push(job, time.monotonic() + self.jittered(self.interval))
+        return None
+
+    def push(self, job, due):
+        heapq.heappush(self.pending, (due, next(self.counter), job))
+        return
+
+    def finish(self, job, result):
+        job = {key: value for key, value in job.items() if key not in ['interval', 'missing']}
+        job['elapsed'] = round(time.monotonic() - job.pop('submitted'), 3)
+        return {**job, **result}
+
+    def wait_slot(self, due):
+        ## espera a que toque la tarea y a que el tope global de consultas lo permita
+        now = time.monotonic()
+        wait = max(due - now, self.last_poll + self.min_gap - now, 0.0)
+        if wait:
+            time.sleep(wait)
+        self.last_poll = time.monotonic()
+        return
+
+    def poll(self, job):
+        result = getattr(self.agent, job['operation'] + '_result')(job['plant_id'], job['task_id'])
+        job['polls'] += 1
+        self.polls += 1
+        label = f"{job['operation']} {job['plant_id']}"
+        if result is None:
+            job['missing'] += 1
+            if job['missing'] >= self.max_missing:
+                logger.error(f"{label}: Task result not found")
+                return self.finish(job, {'status': 'error', 'message': 'Task result not found'})
+        elif result.get('status') != 'pending':
+            if result.get('status') == 'success':
+                logger.info(f"{label}: Task completed successfully")
+            elif result.get('status') == 'error':
+                logger.error(f"{label}: Task failed")
+            else:
+                logger.error(f"{label}: Task status unknown")
+            return self.finish(job, result)
+        else:
+            logger.debug(f"{label}: Task is pending")
+        if self.timeout is not None and time.monotonic() - job['submitted'] > self.timeout:
+            logger.error(f"{label}: Task timed out")
+            return self.finish(job, {'status': 'error', 'message': 'Task timed out'})
+        job['interval'] = min(job['interval'] * self.backoff, self.max_interval)
+        self.push(job, time.monotonic() + self.jittered(job['interval']))
+        return None
+
+    def as_completed(self, submissions=()):
+        ## submissions: (method_str, plant_id, query_params); los resultados salen al resolverse.
+        ## Con max_in_flight solo se programan tareas nuevas cuando se libera un cupo
+        submissions = iter(submissions)
+        exhausted = False
+        while True:
+            while not exhausted and (self.max_in_flight is None or len(self.pending) < self.max_in_flight):
+                submission = next(submissions, None)
+                if submission is None:
+                    exhausted = True
+                    break
+                result = self.submit(*submission)
+                if result is not None:
+                    yield result
+            if not self.pending:
+                if exhausted:
+                    return
+                continue
+            due, _, job = heapq.heappop(self.pending)
+            self.wait_slot(due)
+            result = self.poll(job)
+            if result is not None:
+                yield result
+
+    def run(self, submissions):
+        ## todos los resultados, en el orden de las submissions
+        submissions = list(submissions)
+        results = list(self.as_completed(submissions))
+        order = {(method_str, plant_id, query_params): index
+                 for index, (method_str, plant_id, query_params) in enumerate(submissions)}
+        return sorted(results, key=lambda result: order.get(
+            (result['operation'], result['plant_id'], result['query']), len(order)))
@@ -0,0 +1,108 @@
+import os, json, time, hashlib, threading
+from bisect import bisect_right
+
+## Registro en disco de los chunks ya aceptados por el servidor, por planta, endpoint y
+## hash del archivo. Si una subida se corta, al repetirla se saltan las filas confirmadas.
+## Cuando la subida termina la entrada se borra: volver a subir el mismo archivo (por ejemplo
+## despues de borrar las mediciones en el servidor) manda todas las filas de nuevo.
+
+LEDGER_PATH = os.path.join(os.path.dirname(__file__), 'checkpoints.json')
+MAX_AGE = 30 * 24 * 3600
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    def __init__(self, ledger, key, entry):
+        self.ledger = ledger
+        self.key = key
+        self.ranges = [tuple(r) for r in entry.get('acked', [])]
+        self.starts = [start for start, _ in self.ranges]
+
+    def is_acked(self, index):
+        position = bisect_right(self.starts, index) - 1
+        return position >= 0 and index < self.ranges[position][1]
+
+    def acked_rows(self):
+        return sum(end - start for start, end in self.ranges)
+
+    def first_unacked(self):
+        if self.ranges and self.ranges[0][0] == 0:
+            return self.ranges[0][1]
+        return 0
+
+    def ack(self, start, end):
+        with self.ledger.lock:
+            ranges = sorted(self.ranges + [(start, end)])
+            merged = [ranges[0]]
+            for range_start, range_end in ranges[1:]:
+                if range_start <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+                else:
+                    merged.append((range_start, range_end))
+            self.ranges = merged
+            self.starts = [range_start for range_start, _ in merged]
+            self.ledger.update(self.key, {'acked': merged})
+        return
+
+    def clear(self):
+        with self.ledger.lock:
+            self.ranges = []
+            self.starts = []
+            self.ledger.remove(self.key)
+        return
+
+
+class UploadLedger:
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        ## las entradas marcadas 'complete' son de subidas ya terminadas (formato anterior)
+        now = time.time()
+        return {key: entry for key, entry in entries.items()
+                if now - entry.get('updated', now) < MAX_AGE and not entry.get('complete')}
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        return
+
+    def update(self, key, entry):
+        with self.lock:
+            entry['updated'] = time.time()
+            self.entries[key] = entry
+            self.save()
+        return
+
+    def remove(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.save()
+        return
+
+    def checkpoint(self, plant_id, endpoint, content_hash, resume=True):
+        ## con resume=False se descarta lo confirmado antes y la subida parte desde cero
+        key = f"{plant_id}:{endpoint}:{content_hash}"
+        with self.lock:
+            if not resume:
+                self.remove(key)
+            return Checkpoint(self, key, self.entries.get(key, {}))
+
+    def checkpoint_for_file(self, plant_id, endpoint, path, resume=True):
+        return self.checkpoint(plant_id, endpoint, file_hash(path), resume)
@@ -0,0 +1,130 @@
+import os, json
+import logging
+from .ApiAgents import APIAdminAgent, APIAgent
+from .DataReaders import iter_raw_records, iter_records, detect_format
+from .UploadLedger import UploadLedger
+from .DeltaSync import sync_measurements
+from utils.Tracing import span
+
+logger = logging.getLogger(__name__)
+
+CHUNKED_OPERATIONS = ["post_gen_measurements", "post_weather_measurements", "post_incidents"]
+UPLOAD_OPERATIONS = CHUNKED_OPERATIONS + ["post_prmt_measurements"]
+
+
+def upload_failed(response):
+    ## las subidas por chunks devuelven un resumen con status en vez de None
+    if response is None:
+        return True
+    return isinstance(response, dict) and response.get("status") == "error"
+
+
+## Sesion de subida en el mismo proceso: un agente, una autenticacion y un ledger
+## compartidos por todas las subidas de un pipeline.
+##
+##     with UploadSession() as session:
+##         session.upload_gen(plant_id, path)
+##         session.upload_incidents(plant_id, 'gen', path)
+
+class UploadSession:
+    def __init__(self, admin=True, workers=None, agent=None, ledger=None, resume=None, uploads=1):
+        ## workers son los chunks en vuelo por archivo (UPLOAD_WORKERS) y uploads los archivos que
+        ## se suben a la vez desde distintos threads; el pool de conexiones alcanza para ambos.
+        ## resume=False (o UPLOAD_RESUME=false) sube los archivos completos aunque el ledger
+        ## tenga filas confirmadas de una subida cortada
+        if agent is None:
+            chunk_workers = workers or int(os.getenv('UPLOAD_WORKERS', '1'))
+            pool_size = max(int(os.getenv('POOL_SIZE', '10')), max(uploads, 1) * chunk_workers)
+            agent_class = APIAdminAgent if admin else APIAgent
+            agent = agent_class(pool_size=pool_size, upload_workers=workers)
+        if resume is None:
+            resume = os.getenv('UPLOAD_RESUME', 'true').lower() not in ['false', '0', 'no']
+        self.agent = agent
+        self.ledger = ledger if ledger is not None else UploadLedger()
+        self.resume = resume
+        self.authenticated = False
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return
+
+    def close(self):
+        self.agent.close()
+        return
+
+    def auth(self):
+        ## la expiracion del token se revisa localmente, solo se vuelve al servidor cerca de expirar
+        if not self.authenticated or self.agent.token_state() != 'fresh':
+            with span('auth', 'auth'):
+                self.authenticated = self.agent.auth()
+        return self.authenticated
+
+    def upload(self, operation, plant_id, path, table=None):
+        if operation not in UPLOAD_OPERATIONS:
+            raise ValueError(f"Invalid upload operation: {operation}")
+        if operation == "post_incidents" and table not in ["gen", "weather"]:
+            raise ValueError(f"Invalid table: {table}")
+        plant_id = str(plant_id)
+        if not os.path.exists(path):
+            logger.error(f"Data file not found: {path}")
+            return None
+        if not self.auth():
+            logger.error("Authentication failed")
+            return None
+        try:
+            if operation == "post_prmt_measurements":
+                if detect_format(path) == "json":
+                    with open(path, "r") as file:
+                        data = file.read()
+                    json.loads(data)
+                else:
+                    data = json.dumps(list(iter_records(path)))
+                return self.agent.post_prmt_measurements(plant_id, data)
+            data = iter_raw_records(path)
+            if operation == "post_incidents":
+                checkpoint = self.ledger.checkpoint_for_file(plant_id, f"post_incidents_{table}", path,
+                                                             self.resume)
+                return self.agent.post_incidents(plant_id, table, data, checkpoint=checkpoint)
+            checkpoint = self.ledger.checkpoint_for_file(plant_id, operation, path, self.resume)
+            return getattr(self.agent, operation)(plant_id, data, checkpoint=checkpoint)
+        except ValueError as e:
+            logger.error(f"Invalid data file for {operation}: {path}")
+            logger.debug(e)
+            return None
+
+    def upload_gen(self, plant_id, path):
+        return self.upload("post_gen_measurements", plant_id, path)
+
+    def upload_weather(self, plant_id, path):
+        return self.upload("post_weather_measurements", plant_id, path)
+
+    def upload_incidents(self, plant_id, table, path):
+        return self.upload("post_incidents", plant_id, path, table)
+
+    def upload_prmt(self, plant_id, path):
+        return self.upload("post_prmt_measurements", plant_id, path)
+
+    def sync(self, table, plant_id, path):
+        ## sube solo lo que falta o cambio respecto al servidor, ver DeltaSync
+        if not os.path.exists(path):
+            logger.error(f"Data file not found: {path}")
+            return None
+        if not self.auth():
+            logger.error("Authentication failed")
+            return None
+        try:
+            return sync_measurements(self.agent, table, str(plant_id), iter_records(path))
+        except ValueError as e:
+            logger.error(f"Invalid data file for {table} sync: {path}")
+            logger.debug(e)
+            return None
+
+    def sync_gen(self, plant_id, path):
+        return self.sync("gen", plant_id, path)
+
+    def sync_weather(self, plant_id, path):
+        return self.sync("weather", plant_id, path)
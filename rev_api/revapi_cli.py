@@ -1,10 +1,12 @@
 import sys, getopt
 from .MiddlewareAgent import MiddlewareAgent, setup_logger
+from .Metrics import export_metrics
 from requests.exceptions import ConnectionError
 
-options="hl:Ardf:i:q:t:"
+options="hl:Ardf:i:q:t:w:zW:o:m:"
 long_options=["help", "log_level=", "admin", "range", "detailed",
-               "file=", "id=", "query=", "table="]
+               "file=", "id=", "query=", "table=", "workers=", "gzip",
+               "window=", "output=", "metrics=", "prometheus=", "no_resume"]
 
 help_message = """
 Usage: revapi_cli.py [options] operation
@@ -22,8 +24,29 @@ Options:
                             requires data and this option is not set, you
                             will be prompted to enter the path to the file.
     -i, --id                Set the id (portfolio/plant) for the operations.
+                            generate_* operations accept a comma separated
+                            list of plant ids, polled together.
     -q, --query             Set the query parameters for the operations.
     -t, --table             Set the table name for post_incidents operation.
+    -w, --workers           Set the number of chunks uploaded concurrently by
+                            post_gen_measurements, post_weather_measurements
+                            and post_incidents (default: UPLOAD_WORKERS or 1).
+    -z, --gzip              Send measurement, incident and PRMT uploads gzip
+                            compressed (default: REQUEST_COMPRESSION). Falls
+                            back to plain JSON if the server rejects it.
+    -W, --window            Split get_gen_measurements, get_weather_measurements
+                            and get_prmt_measurements ranges into day, week or
+                            N-day windows fetched concurrently (RANGE_WORKERS).
+    -o, --output            Write the merged range to a .json, .ndjson or .npz
+                            file instead of logging it.
+    -m, --metrics           Write per-endpoint request metrics (counts, status
+                            codes, p50/p95/p99 latency, bytes, retries) as JSON
+                            at the end of the run (default: METRICS_PATH).
+    --prometheus            Also write them as a Prometheus textfile
+                            (default: METRICS_PROM_PATH).
+    --no_resume             Upload the whole file even if an interrupted upload
+                            of it left acknowledged chunks in the checkpoint
+                            ledger (default: UPLOAD_RESUME).
     
 
 Operations:
@@ -77,6 +100,13 @@ def main(argv):
     query = None
     id = None
     table = None
+    workers = None
+    compression = None
+    window = None
+    output_path = None
+    metrics_path = None
+    prometheus_path = None
+    resume = None
 
     try:
         opts, args = getopt.gnu_getopt(argv, options, long_options)
@@ -110,11 +140,32 @@ def main(argv):
             if table not in ['gen', 'weather']:
                 print("Invalid table name")
                 sys.exit(2)
+        elif opt in ("-w", "--workers"):
+            if not arg.isdigit() or int(arg) < 1:
+                print("Invalid number of workers")
+                sys.exit(2)
+            workers = int(arg)
+        elif opt in ("-z", "--gzip"):
+            compression = True
+        elif opt in ("-W", "--window"):
+            if arg not in ["day", "week"] and (not arg.isdigit() or int(arg) < 1):
+                print("Invalid window, expected day, week or a number of days")
+                sys.exit(2)
+            window = arg
+        elif opt in ("-o", "--output"):
+            output_path = arg
+        elif opt in ("-m", "--metrics"):
+            metrics_path = arg
+        elif opt == "--prometheus":
+            prometheus_path = arg
+        elif opt == "--no_resume":
+            resume = False
 
     logger = setup_logger(log_level)
 
     agent = MiddlewareAgent("admin" if admin else "user", log_level,
-                            data_path, query, id, table)
+                            data_path, query, id, table, workers, compression, window,
+                            output_path, resume)
     try:
         if agent.auth() is False:
             print("Authentication failed")
@@ -231,6 +282,8 @@ def main(argv):
     except ConnectionError as e:
         print("Connection error")
         sys.exit(2)
+    finally:
+        export_metrics(metrics_path, prometheus_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,132 @@
+import time, queue, threading, logging
+
+logger = logging.getLogger(__name__)
+
+## Ejecutor de etapas en streaming: cada item (ej. una planta) pasa por las etapas en
+## orden, y cada etapa tiene sus propios workers. Entre etapas hay colas acotadas, asi
+## una etapa lenta frena a las anteriores en vez de acumular archivos en disco.
+##
+##     executor = StageExecutor([Stage('download', download, 2),
+##                               Stage('impute', impute, 4),
+##                               Stage('upload', upload, 2)], queue_size=2)
+##     results = executor.run(plants)
+
+STOP = object()
+
+
+class Stage:
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(int(workers), 1)
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def record(self, busy, waiting, ok):
+        with self.lock:
+            self.busy += busy
+            self.waiting += waiting
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+        return
+
+
+class StageResult:
+    def __init__(self, index, item):
+        self.index = index
+        self.item = item
+        self.value = item
+        self.error = None
+        self.failed_stage = None
+        self.timings = {}
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class StageExecutor:
+    def __init__(self, stages, queue_size=2):
+        if not stages:
+            raise ValueError("At least one stage is required")
+        self.stages = stages
+        self.queue_size = max(int(queue_size), 1)
+        self.elapsed = None
+
+    def worker(self, stage, inbox, outbox, results):
+        while True:
+            wait_start = time.perf_counter()
+            result = inbox.get()
+            waited = time.perf_counter() - wait_start
+            if result is STOP:
+                inbox.put(STOP)
+                return
+            start = time.perf_counter()
+            try:
+                result.value = stage.func(result.value)
+            except Exception as e:
+                ## el fallo queda aislado al item, las demas plantas siguen su curso
+                result.error = e
+                result.failed_stage = stage.name
+                logger.error(f"Stage {stage.name} failed for item {result.index}: {e}")
+            busy = time.perf_counter() - start
+            result.timings[stage.name] = busy
+            stage.record(busy, waited, result.ok)
+            if result.ok and outbox is not None:
+                ## put bloquea si la etapa siguiente esta saturada (backpressure)
+                outbox.put(result)
+            else:
+                results.append(result)
+
+    def run(self, items):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = []
+        start = time.perf_counter()
+        groups = []
+        for position, stage in enumerate(self.stages):
+            outbox = queues[position + 1] if position + 1 < len(self.stages) else None
+            threads = [threading.Thread(target=self.worker, name=f"{stage.name}-{number}",
+                                        args=(stage, queues[position], outbox, results), daemon=True)
+                       for number in range(stage.workers)]
+            for thread in threads:
+                thread.start()
+            groups.append(threads)
+        for index, item in enumerate(items):
+            queues[0].put(StageResult(index, item))
+        ## cada etapa se cierra cuando terminan todos los workers de la anterior
+        for position, threads in enumerate(groups):
+            queues[position].put(STOP)
+            for thread in threads:
+                thread.join()
+        self.elapsed = time.perf_counter() - start
+        return sorted(results, key=lambda result: result.index)
+
+    def report(self):
+        if self.elapsed is None:
+            return []
+        rows = []
+        for stage in self.stages:
+            capacity = stage.workers * self.elapsed
+            rows.append({
+                'stage': stage.name,
+                'workers': stage.workers,
+                'processed': stage.processed,
+                'failed': stage.failed,
+                'busy': round(stage.busy, 2),
+                'idle': round(stage.waiting, 2),
+                'utilization': round(stage.busy / capacity, 3) if capacity else 0.0,
+            })
+        return rows
+
+    def log_report(self, log=None):
+        log = log or logger
+        log.info(f"Pipeline finished in {self.elapsed:.1f}s")
+        for row in self.report():
+            log.info(f"  {row['stage']:<10} workers={row['workers']} processed={row['processed']} "
+                     f"failed={row['failed']} busy={row['busy']}s utilization={row['utilization']:.0%}")
+        return
@@ -0,0 +1,102 @@
+import os, json, time, threading, logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+## Trazas de los pipelines en formato Chrome trace (se abren en Perfetto o chrome://tracing).
+## Cada span es un evento completo ('X') con inicio y duracion en el thread donde corrio,
+## asi las etapas por planta y los requests HTTP que hacen quedan anidados. Desactivado por
+## defecto: sin enable_tracing (o TRACE_PATH) span() no registra nada.
+##
+##     enable_tracing('trace.json')
+##     with span('upload_data', 'stage', plant='PFV Example'):
+##         ...
+##     save_trace()
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def enable(self, path):
+        self.enabled = True
+        self.path = path
+        return
+
+    def timestamp(self, moment):
+        ## microsegundos desde que se creo el tracer
+        return round((moment - self.origin) * 1e6, 1)
+
+    def add(self, name, category, start, duration, pid=None, tid=None, thread_name=None, args=None):
+        ## start es un time.perf_counter(), tambien de otro proceso (el reloj es monotono del sistema)
+        if not self.enabled:
+            return
+        if tid is None:
+            thread = threading.current_thread()
+            tid, thread_name = thread.ident, thread.name
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': self.timestamp(start),
+                 'dur': round(duration * 1e6, 1), 'pid': pid or self.pid, 'tid': tid, 'args': args or {}}
+        with self.lock:
+            self.events.append(event)
+            if thread_name is not None:
+                self.threads[(pid or self.pid, tid)] = thread_name
+        return
+
+    @contextmanager
+    def span(self, name, category='pipeline', **args):
+        ## el dict de args se entrega al bloque para agregar datos que se conocen al final (status, bytes)
+        if not self.enabled:
+            yield args
+            return
+        start = time.perf_counter()
+        try:
+            yield args
+        except Exception as e:
+            args['error'] = type(e).__name__
+            raise
+        finally:
+            self.add(name, category, start, time.perf_counter() - start, args=args)
+
+    def trace(self):
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0,
+                     'args': {'name': 'pipeline'}}]
+        metadata += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                     for (pid, tid), name in threads.items()]
+        return {'traceEvents': metadata + sorted(events, key=lambda event: event['ts']),
+                'displayTimeUnit': 'ms'}
+
+    def save(self, path=None):
+        path = path or self.path
+        with open(path, 'w') as f:
+            json.dump(self.trace(), f)
+        return path
+
+
+TRACER = Tracer()
+
+
+def enable_tracing(path=None):
+    ## sin path se usa TRACE_PATH; devuelve si quedo activado
+    path = path or os.getenv('TRACE_PATH')
+    if path:
+        TRACER.enable(path)
+    return TRACER.enabled
+
+def span(name, category='pipeline', **args):
+    return TRACER.span(name, category, **args)
+
+def save_trace():
+    if not TRACER.enabled:
+        return None
+    path = TRACER.save()
+    logger.info(f"Trace with {len(TRACER.events)} spans written to {path}")
+    return path